@@ -0,0 +1,351 @@
+"""
+Near-duplicate alignment between the 3rd-cycle self-assessment text and the
+4th-cycle reports: finds the paragraphs and table rows that were carried over
+(as they were or revised) and reports each pair with its similarity and the
+3rd-cycle page.
+
+Units (paragraphs / table rows) are shingled into character 4-grams of the
+normalized text (spacing, punctuation, digits and HTML tags ignored, so
+updated figures do not hide a carried-over sentence). Every unit gets a
+MinHash signature; LSH banding puts units that agree on a whole band into the
+same bucket, and only those candidate pairs are compared (exact Jaccard of
+the shingle sets). Units with the same normalized text (e.g. table rows that
+differ only in their figures) are hashed once as a group, and a group is
+reported once per 4th-cycle unit, so work grows with the size of the corpus,
+not with the number of unit pairs.
+
+DOCX extracts carry no page numbers; their page is taken from the matching
+paragraph of the PDF extract (or the previous one that matched) and shown
+as "≈p.N".
+
+Usage:
+    python scripts/align_cycles.py
+    python scripts/align_cycles.py --threshold 0.7 --csv metrics/alignment.csv
+    python scripts/align_cycles.py --fourth "report/3.2 *.md"
+"""
+import re
+import csv
+import time
+import argparse
+import numpy as np
+from instrument import stage
+from search_index import HEADING_RE, PAGE_RE, TABLE_RE, normalize, resolve_sources
+
+# --- Configuration ---
+THIRD_CYCLE = ["temp_3rd_cycle_content.txt", "3rd_cycle_extracted.txt"]
+FOURTH_CYCLE = ["report/3.*.md"]
+SHINGLE = 4
+# Units shorter than this (normalized characters) are headers, page furniture etc.
+MIN_CHARS = 20
+# 128 hash functions in 32 bands of 4 rows: pairs with Jaccard ~0.4 and up
+# share a band with good probability, pairs below ~0.2 rarely do
+NUM_PERM, BANDS = 128, 32
+ROWS = NUM_PERM // BANDS
+THRESHOLD = 0.5
+# Buckets larger than this are skipped in their band (boilerplate shared by
+# many distinct units); true pairs still meet in one of the other bands
+MAX_BUCKET = 100
+PRIME = (1 << 31) - 1
+BASE = 1_000_003
+
+TAG_RE = re.compile(r"<[^>]+>")
+DIGIT_RE = re.compile(r"\d+")
+LIST_RE = re.compile(r"^(?:[-*>•·]\s*|\d+\.\s+)+")
+# PDF lines wrap mid-sentence; a paragraph ends with a sentence ending (…함/…임/…다.)
+SENTENCE_END_RE = re.compile(r"[다함음임됨.!?][)\]\"'”’」]*$")
+
+def split_units(lines):
+    """
+    Yields (line, page, section, kind, text) for every paragraph ("para") and
+    table row ("row"). Within "--- Page N ---" pages (PDF extract) wrapped
+    lines are joined up to the next sentence ending; elsewhere every line is
+    a paragraph.
+    """
+    page = section = None
+    in_table = False
+    para, start = [], 0
+
+    def flush():
+        if para:
+            yield start, page, section, "para", " ".join(para)
+            para.clear()
+
+    for no, raw in enumerate(lines, 1):
+        line = raw.strip()
+        match = PAGE_RE.match(line)
+        if match:
+            yield from flush()
+            page, in_table = int(match.group(1)), False
+            continue
+        match = TABLE_RE.match(line)
+        if match:
+            yield from flush()
+            in_table = match.group(1) != "END"
+            continue
+        match = HEADING_RE.match(line)
+        if match:
+            yield from flush()
+            section, in_table = match.group(1).strip(), False
+            continue
+        if not line or line.startswith("<!--"):
+            yield from flush()
+            # DOCX "[TABLE n]" blocks end with a blank line
+            in_table = in_table and page is not None
+            continue
+        if in_table or line.startswith("|"):
+            yield from flush()
+            if not set(line) <= set("|-: "):
+                yield no, page, section, "row", line
+            continue
+        if not para:
+            start = no
+        para.append(LIST_RE.sub("", line))
+        if page is None or SENTENCE_END_RE.search(line):
+            yield from flush()
+    yield from flush()
+
+def load_units(patterns, cycle: int) -> list[dict]:
+    units = []
+    for path in resolve_sources(patterns):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line, page, section, kind, text in split_units(f):
+                exact = normalize(TAG_RE.sub("", text))
+                norm = DIGIT_RE.sub("", exact)
+                if len(norm) >= MIN_CHARS:
+                    units.append({"cycle": cycle, "path": path, "line": line, "page": page,
+                                  "section": section, "kind": kind, "text": text,
+                                  "norm": norm, "exact": exact})
+    return units
+
+def shingle_hashes(texts: list[str]):
+    """
+    Distinct shingle hashes of all texts, sorted by (text, hash), as one array
+    plus the offset of every text's segment. Polynomial rolling hashes of the
+    code points are computed for the whole corpus at once.
+    """
+    lengths = np.array([len(t) for t in texts])
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"),
+                          dtype=np.uint32).astype(np.uint64)
+    powers = np.array([pow(BASE, SHINGLE - 1 - i, PRIME) for i in range(SHINGLE)], dtype=np.uint64)
+    windows = np.lib.stride_tricks.sliding_window_view(codes, SHINGLE)
+    hashes = (windows % PRIME * powers).sum(axis=1) % PRIME
+    # Keep windows that start and end inside one unit
+    ends = np.cumsum(lengths)
+    unit_of = np.repeat(np.arange(len(texts)), lengths)[:len(hashes)]
+    valid = np.arange(len(hashes)) + SHINGLE <= ends[unit_of]
+    keys = np.sort((unit_of[valid].astype(np.uint64) << np.uint64(32)) | hashes[valid])
+    keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+    unit_ids = (keys >> np.uint64(32)).astype(np.int64)
+    offsets = np.searchsorted(unit_ids, np.arange(len(texts) + 1))
+    return keys & np.uint64(0xFFFFFFFF), offsets
+
+def minhash(hashes: np.ndarray, offsets: np.ndarray, seed: int = 1) -> np.ndarray:
+    """
+    (units, NUM_PERM) MinHash signatures. The hash functions are
+    multiply-shift hashes h(x) = ((a*x + b) mod 2**64) >> 32 with random odd a,
+    which numpy evaluates with wrapping uint64 arithmetic.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)
+    signatures = np.empty((len(offsets) - 1, NUM_PERM), dtype=np.uint32)
+    # A few hash functions at a time keeps the (functions, shingles) array small
+    for lo in range(0, NUM_PERM, 16):
+        values = (a[lo:lo + 16, None] * hashes[None, :] + b[lo:lo + 16, None]) >> np.uint64(32)
+        signatures[:, lo:lo + 16] = np.minimum.reduceat(values, offsets[:-1], axis=1).T
+    return signatures
+
+def bucket_pairs(bucket: np.ndarray, max_bucket: int = MAX_BUCKET):
+    """
+    All pairs (i < j) of rows with the same bucket id, as two arrays, built
+    without a Python loop. Returns (i, j, number of oversized buckets skipped).
+    """
+    sizes = np.bincount(bucket)
+    keep = (sizes > 1) & (sizes <= max_bucket)
+    members = np.flatnonzero(keep[bucket])
+    members = members[np.argsort(bucket[members], kind="stable")]
+    skipped = int(np.count_nonzero(sizes > max_bucket))
+    if not len(members):
+        return members, members, skipped
+    size = sizes[bucket[members]]
+    # Position of each member within its bucket; it pairs with the ones after it
+    starts = np.flatnonzero(np.r_[True, bucket[members][1:] != bucket[members][:-1]])
+    position = np.arange(len(members)) - np.repeat(starts, sizes[bucket[members[starts]]])
+    later = size - 1 - position
+    first = np.repeat(np.arange(len(members)), later)
+    step = np.arange(len(first)) - np.repeat(np.cumsum(later) - later, later) + 1
+    return members[first], members[first + step], skipped
+
+def lsh_candidates(signatures: np.ndarray, wanted) -> tuple[np.ndarray, np.ndarray, int]:
+    """
+    Row pairs (i < j) that share at least one band and for which the
+    vectorized wanted(i, j) holds. Returns (i, j, oversized buckets skipped).
+    """
+    n = len(signatures)
+    found, skipped = [], 0
+    for band in range(BANDS):
+        block = np.ascontiguousarray(signatures[:, band * ROWS:(band + 1) * ROWS])
+        keys = block.view(np.dtype((np.void, block.itemsize * ROWS))).ravel()
+        _, bucket = np.unique(keys, return_inverse=True)
+        i, j, over = bucket_pairs(bucket.ravel())
+        skipped += over
+        mask = wanted(i, j)
+        found.append(i[mask].astype(np.int64) * n + j[mask])
+    pairs = np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+    return pairs // n, pairs % n, skipped
+
+def jaccard(hashes: np.ndarray, offsets: np.ndarray, i: int, j: int) -> float:
+    a = hashes[offsets[i]:offsets[i + 1]]
+    b = hashes[offsets[j]:offsets[j + 1]]
+    common = len(np.intersect1d(a, b, assume_unique=True))
+    return common / (len(a) + len(b) - common)
+
+def align(third_patterns=None, fourth_patterns=None, threshold: float = THRESHOLD) -> dict:
+    """
+    Returns {"units", "candidates", "pairs"}; each pair has the 4th-cycle unit,
+    the 3rd-cycle unit, their similarity (Jaccard of the shingle sets) and the
+    number of 3rd-cycle units with the same normalized text ("copies").
+    """
+    with stage("load_units") as rec:
+        units = (load_units(third_patterns or THIRD_CYCLE, 3)
+                 + load_units(fourth_patterns or FOURTH_CYCLE, 4))
+        rec["units"] = len(units)
+    if not units:
+        return {"units": [], "candidates": 0, "pairs": []}
+
+    # Units with the same normalized text form one group, hashed once
+    group_of, texts = {}, []
+    groups = []  # per group: {"new": [...], "old": [...], "paged": [...], "unpaged": [...]}
+    for unit_id, unit in enumerate(units):
+        g = group_of.setdefault(unit["norm"], len(texts))
+        if g == len(texts):
+            texts.append(unit["norm"])
+            groups.append({"new": [], "old": [], "paged": [], "unpaged": []})
+        members = groups[g]
+        if unit["cycle"] == 4:
+            members["new"].append(unit_id)
+        else:
+            members["old"].append(unit_id)
+            members["paged" if unit["page"] is not None else "unpaged"].append(unit_id)
+
+    with stage("minhash", units=len(units), groups=len(texts)):
+        hashes, offsets = shingle_hashes(texts)
+        signatures = minhash(hashes, offsets)
+
+    has = {key: np.array([bool(g[key]) for g in groups]) for key in ("new", "old", "paged", "unpaged")}
+
+    def wanted(i, j):
+        # 4th <-> 3rd pairs, and PDF <-> DOCX pairs of the 3rd cycle (for pages)
+        return ((has["new"][i] & has["old"][j]) | (has["old"][i] & has["new"][j])
+                | (has["paged"][i] & has["unpaged"][j]) | (has["unpaged"][i] & has["paged"][j]))
+
+    with stage("lsh", units=len(units), groups=len(texts)) as rec:
+        first, second, skipped = lsh_candidates(signatures, wanted)
+        rec["candidates"] = len(first)
+        rec["buckets_skipped"] = skipped
+
+    def representative(group, key, unit_id):
+        # Prefer a member with the same figures, i.e. an unchanged carry-over
+        by_exact = group.setdefault(key + "_exact", {})
+        if not by_exact:
+            for m in reversed(group[key]):
+                by_exact[units[m]["exact"]] = m
+        return by_exact.get(units[unit_id]["exact"], group[key][0])
+
+    pairs, page_of = [], {}
+
+    def link(g, h, score):
+        # 4th-cycle units of g against the 3rd-cycle text of h, and pages for g's DOCX units
+        old = groups[h]
+        if old["old"]:
+            for new in groups[g]["new"]:
+                pairs.append({"new": new, "old": representative(old, "old", new),
+                              "score": round(score, 3), "copies": len(old["old"])})
+        if old["paged"]:
+            for unpaged in groups[g]["unpaged"]:
+                if score > page_of.get(unpaged, (0, None))[0]:
+                    page_of[unpaged] = (score, units[representative(old, "paged", unpaged)]["page"])
+
+    for g in range(len(groups)):
+        link(g, g, 1.0)
+    for g, h in zip(first.tolist(), second.tolist()):
+        score = jaccard(hashes, offsets, g, h)
+        if score >= threshold:
+            link(g, h, score)
+            link(h, g, score)
+
+    for unit_id, (_, page) in page_of.items():
+        units[unit_id]["inferred_page"] = page
+    # Units without a PDF match take the page of the previous matched unit
+    last = None
+    for i, unit in enumerate(units):
+        if unit["cycle"] != 3 or unit["page"] is not None:
+            continue
+        if i and units[i - 1]["path"] != unit["path"]:
+            last = None
+        last = unit.setdefault("inferred_page", last)
+
+    pairs.sort(key=lambda p: (units[p["new"]]["path"], units[p["new"]]["line"], -p["score"],
+                              units[p["old"]]["path"], units[p["old"]]["line"]))
+    return {"units": units, "candidates": len(first), "pairs": pairs}
+
+def format_page(unit: dict) -> str:
+    if unit["page"] is not None:
+        return f"p.{unit['page']}"
+    if unit.get("inferred_page") is not None:
+        return f"≈p.{unit['inferred_page']}"
+    return "p.?"
+
+def clip(text: str, width: int = 70) -> str:
+    text = TAG_RE.sub("", text).replace("\n", " ")
+    return text if len(text) <= width else text[:width] + "…"
+
+def write_csv(path, result):
+    units = result["units"]
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["similarity", "report", "report_line", "section", "kind",
+                         "source", "source_line", "source_page", "source_copies",
+                         "report_text", "source_text"])
+        for pair in result["pairs"]:
+            new, old = units[pair["new"]], units[pair["old"]]
+            writer.writerow([pair["score"], new["path"], new["line"], new["section"] or "", new["kind"],
+                             old["path"], old["line"], format_page(old), pair["copies"],
+                             new["text"], old["text"]])
+
+def main():
+    parser = argparse.ArgumentParser(description="Align carried-over 3rd-cycle passages with the 4th-cycle reports")
+    parser.add_argument("--third", nargs="+", help=f"3rd-cycle text files or globs (default: {THIRD_CYCLE})")
+    parser.add_argument("--fourth", nargs="+", help=f"4th-cycle report files or globs (default: {FOURTH_CYCLE})")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="Minimum similarity (Jaccard of 4-gram shingles)")
+    parser.add_argument("--csv", type=str, metavar="FILE", help="Also write all pairs as CSV")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = align(args.third, args.fourth, args.threshold)
+    elapsed = time.perf_counter() - start
+    units = result["units"]
+
+    current = None
+    for pair in result["pairs"]:
+        new, old = units[pair["new"]], units[pair["old"]]
+        if (new["path"], new["line"]) != current:
+            current = (new["path"], new["line"])
+            print(f"\n{new['path']}:{new['line']}" + (f" § {new['section']}" if new["section"] else ""))
+            print(f"    {clip(new['text'])}")
+        copies = f" (+{pair['copies'] - 1} identical)" if pair["copies"] > 1 else ""
+        print(f"  {pair['score']:.2f}  {old['path']}:{old['line']} {format_page(old)}{copies}  "
+              f"{clip(old['text'], 50)}")
+
+    n_new = sum(u["cycle"] == 4 for u in units)
+    matched = len({p["new"] for p in result["pairs"]})
+    print(f"\n{len(units)} units ({len(units) - n_new} 3rd-cycle, {n_new} 4th-cycle), "
+          f"{result['candidates']} LSH candidate pairs, {len(result['pairs'])} pairs >= {args.threshold:g}; "
+          f"{matched} 4th-cycle units carried over, in {elapsed * 1000:.0f} ms")
+    if args.csv:
+        write_csv(args.csv, result)
+        print(f"Saved {args.csv}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Benchmark suite for the 3.x pipeline on synthetic large-scale fixtures.
+
+Usage:
+    python scripts/benchmark.py                   # run and compare with the baseline
+    python scripts/benchmark.py --save-baseline   # run and store the results as the baseline
+    python scripts/benchmark.py --quick           # smaller fixtures for a fast check
+
+Fixtures are generated into .cache/bench and reused on later runs.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import tracemalloc
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pypdfium2
+
+import pdf_cache
+import excel_cache
+from extract_3_1_from_pdf import extract_rows_from_pdf
+from parsers import (FULLTIME_RATIO_COLUMNS, ROSTER_COLUMNS, count_new_hires,
+                     parse_fulltime_ratio, parse_new_hires)
+from renderer import update_markdown_block, update_markdown_blocks
+from update_3_1 import calc_ratios, calc_ratios_batch
+
+# --- Configuration ---
+REPO_ROOT = Path(os.getcwd())
+FIXTURE_DIR = REPO_ROOT / ".cache" / "bench"
+BASELINE_PATH = REPO_ROOT / "benchmarks" / "baseline.json"
+# Real pages the synthetic PDF is assembled from
+TARGET_PAGE_PDF = REPO_ROOT / "data" / "4th-cycle" / "3.1" / "2021 정보공시.pdf"
+FILLER_PDF = REPO_ROOT / "3주기 - 대학자체진단평가보고서_ 교원 및 직원.pdf"
+
+SCALES = {
+    "full": {"pdf_pages": 300, "sheets": 3, "sheet_rows": 20000, "ratio_rows": 100000, "blocks": 200,
+             "roster_rows": 300000},
+    "quick": {"pdf_pages": 40, "sheets": 2, "sheet_rows": 2000, "ratio_rows": 10000, "blocks": 40,
+              "roster_rows": 20000},
+}
+# A benchmark only counts as a regression when it is measured on at least
+# MIN_REPEAT runs and its median is more than MIN_DELTA_S slower than the
+# baseline (besides exceeding --tolerance); single runs of fast steps are noise
+MIN_REPEAT = 3
+MIN_DELTA_S = 0.05
+
+# --- Fixture generators ---
+def make_pdf(path: Path, pages: int):
+    """
+    정보공시-style PDF: filler pages from the 3rd-cycle report with the real
+    target table page placed two thirds of the way in.
+    """
+    filler = pypdfium2.PdfDocument(str(FILLER_PDF))
+    target = pypdfium2.PdfDocument(str(TARGET_PAGE_PDF))
+    out = pypdfium2.PdfDocument.new()
+    target_at = pages * 2 // 3
+    for i in range(pages):
+        if i == target_at:
+            out.import_pages(target, [0])
+        else:
+            out.import_pages(filler, [i % len(filler)])
+    out.save(str(path))
+    for doc in (out, target, filler):
+        doc.close()
+
+def make_workbook(path: Path, sheets: int, rows: int, seed: int = 0):
+    """
+    Multi-sheet workbook in the fulltime_ratio layout (Year, Count, Quota, Ratio, Note).
+    """
+    rng = np.random.default_rng(seed)
+    with pd.ExcelWriter(path) as writer:
+        for sheet in range(sheets):
+            quota = rng.integers(100, 400, rows)
+            count = rng.integers(50, 400, rows)
+            pd.DataFrame({
+                "Year": rng.integers(2015, 2031, rows),
+                "Count": count,
+                "Quota": quota,
+                "Ratio": np.round(count / quota * 100, 1),
+                "Note": rng.choice(["3주기 자료", "4주기 자료"], rows),
+            }).to_excel(writer, sheet_name=f"Sheet{sheet + 1}", index=False)
+
+def make_roster(path: Path, rows: int, seed: int = 0):
+    """
+    HR roster export: one appointment per row across many years, with the
+    name/ID columns a real export carries next to the ones parse_new_hires reads.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2010-03-01") + pd.to_timedelta(rng.integers(0, 16 * 365, rows), unit="D")
+    pd.DataFrame({
+        "교번": np.arange(rows) + 100000,
+        "성명": [f"교원{i}" for i in range(rows)],
+        "소속": rng.choice([f"{c}대학" for c in "가나다라마바사아"], rows),
+        "학과": rng.choice([f"학과{i:02d}" for i in range(60)], rows),
+        "직제": rng.choice(["교수", "부교수", "조교수", "강사", "기타"], rows),
+        "교원유형": rng.choice(["전임(정년트랙)", "전임(비정년트랙)", "겸임", "초빙", "강사"], rows),
+        "임용구분": rng.choice(["신규", "재임용", "승진"], rows, p=[0.2, 0.6, 0.2]),
+        "임용일자": dates,
+    }).to_excel(path, index=False)
+
+def make_faculty_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    faculty_numbers_*.csv layout with many years (two bases per year).
+    """
+    rng = np.random.default_rng(seed)
+    years = np.repeat(np.arange(rows // 2) + 1000, 2)
+    return pd.DataFrame({
+        "연도": years,
+        "기준구분": np.tile(["학생정원", "재학생"], rows // 2),
+        "전임교원수A": rng.integers(150, 350, rows),
+        "겸임교원수": rng.integers(10, 60, rows),
+        "교원법정정원B": rng.integers(250, 450, rows),
+    })
+
+def make_peer_frame(rows: int, years: int = 7, seed: int = 0) -> pd.DataFrame:
+    """
+    Long-format peer table (학교명 x 연도 x 기준구분) as used by calc_ratios_batch.
+    """
+    rng = np.random.default_rng(seed)
+    institutions = rows // (years * 2)
+    n = institutions * years * 2
+    return pd.DataFrame({
+        "학교명": np.repeat([f"대학{i:05d}" for i in range(institutions)], years * 2),
+        "연도": np.tile(np.repeat(np.arange(2019, 2019 + years), 2), institutions),
+        "기준구분": np.tile(["학생정원", "재학생"], n // 2),
+        "전임교원수A": rng.integers(150, 350, n),
+        "겸임교원수": rng.integers(10, 60, n),
+        "교원법정정원B": rng.integers(250, 450, n),
+    }).sample(frac=1, random_state=seed)
+
+def make_report(path: Path, blocks: int):
+    """
+    Report with many AUTO-GEN blocks in both marker styles, separated by prose.
+    """
+    parts = ["# Synthetic report\n\n"]
+    for i in range(blocks):
+        parts.append("본문 단락입니다. " * 40 + "\n\n")
+        if i % 2:
+            parts.append(f"<!-- START: AUTO-GEN id=B{i} -->\n<!-- END: AUTO-GEN -->\n\n")
+        else:
+            parts.append(f"<!-- AUTO-GEN:B{i}-START -->\n<!-- AUTO-GEN:B{i}-END -->\n\n")
+    path.write_text("".join(parts), encoding="utf-8")
+
+def build_fixtures(scale: dict) -> dict:
+    FIXTURE_DIR.mkdir(parents=True, exist_ok=True)
+    tag = f"{scale['pdf_pages']}p"
+    fixtures = {
+        "pdf": FIXTURE_DIR / f"2021 synthetic {tag} 정보공시.pdf",
+        "workbook": FIXTURE_DIR / f"fulltime_ratio_{scale['sheets']}x{scale['sheet_rows']}.xlsx",
+        "report": FIXTURE_DIR / f"report_{scale['blocks']}.md",
+        "roster": FIXTURE_DIR / f"roster_{scale['roster_rows']}.xlsx",
+    }
+    if not fixtures["pdf"].exists():
+        print(f"Generating {fixtures['pdf'].name}...")
+        make_pdf(fixtures["pdf"], scale["pdf_pages"])
+    if not fixtures["workbook"].exists():
+        print(f"Generating {fixtures['workbook'].name}...")
+        make_workbook(fixtures["workbook"], scale["sheets"], scale["sheet_rows"])
+    if not fixtures["roster"].exists():
+        print(f"Generating {fixtures['roster'].name}...")
+        make_roster(fixtures["roster"], scale["roster_rows"])
+    make_report(fixtures["report"], scale["blocks"])
+    return fixtures
+
+# --- Measurement ---
+def measure(func, items: int, repeat: int = 1) -> dict:
+    """
+    Runs func `repeat` times; reports the median wall time ("seconds", the
+    figure compared with the baseline), the best one, throughput (items/s at
+    the median) and the largest peak of traced Python memory.
+    """
+    times, peak = [], 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    median = float(np.median(times))
+    return {"seconds": round(median, 4), "best": round(min(times), 4), "repeat": len(times),
+            "items": items, "throughput": round(items / median, 1) if median else None,
+            "peak_mb": round(peak / 2**20, 2)}
+
+def run_benchmarks(scale: dict, repeat: int) -> dict:
+    fixtures = build_fixtures(scale)
+    results = {}
+    bench_cache = FIXTURE_DIR / "cache"
+
+    def quiet(func):
+        # The pipeline functions print progress; keep benchmark output readable
+        def wrapped():
+            stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+            try:
+                return func()
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+        return wrapped
+
+    # extract_3_1_from_pdf: cold = empty page cache, warm = cache populated
+    pdf_cache.CACHE_DIR = bench_cache / "pdf_pages"
+    def extract_cold():
+        shutil.rmtree(pdf_cache.CACHE_DIR, ignore_errors=True)
+        rows, error = extract_rows_from_pdf(fixtures["pdf"])
+        assert rows and error is None, error
+    results["extract_3_1_from_pdf.cold"] = measure(quiet(extract_cold), scale["pdf_pages"], repeat)
+    results["extract_3_1_from_pdf.warm"] = measure(
+        quiet(lambda: extract_rows_from_pdf(fixtures["pdf"])), scale["pdf_pages"], repeat)
+
+    # parse_fulltime_ratio: cold = no sidecar, warm = sidecar present
+    excel_cache.CACHE_DIR = bench_cache / "excel"
+    def parse_cold():
+        shutil.rmtree(excel_cache.CACHE_DIR, ignore_errors=True)
+        parse_fulltime_ratio([fixtures["workbook"]])
+    results["parse_fulltime_ratio.cold"] = measure(quiet(parse_cold), scale["sheet_rows"], repeat)
+    results["parse_fulltime_ratio.warm"] = measure(
+        quiet(lambda: parse_fulltime_ratio([fixtures["workbook"]])), scale["sheet_rows"], repeat)
+
+    # The parser reads the first sheet only; these read every sheet of the workbook
+    sheets = [f"Sheet{i + 1}" for i in range(scale["sheets"])]
+    def read_sheets():
+        for sheet in sheets:
+            excel_cache.read_excel_cached(fixtures["workbook"], columns=FULLTIME_RATIO_COLUMNS,
+                                          sheet_name=sheet)
+    def read_sheets_cold():
+        shutil.rmtree(excel_cache.CACHE_DIR, ignore_errors=True)
+        read_sheets()
+    sheet_items = scale["sheets"] * scale["sheet_rows"]
+    results["read_excel_cached.all_sheets.cold"] = measure(quiet(read_sheets_cold), sheet_items, repeat)
+    results["read_excel_cached.all_sheets.warm"] = measure(quiet(read_sheets), sheet_items, repeat)
+
+    # parse_new_hires: chunked streaming vs loading the whole roster into one frame
+    def roster_whole():
+        roster = pd.read_excel(fixtures["roster"])
+        count_new_hires(roster[list(ROSTER_COLUMNS)])
+    results["parse_new_hires.chunked"] = measure(
+        quiet(lambda: parse_new_hires([fixtures["roster"]])), scale["roster_rows"], repeat)
+    results["parse_new_hires.read_excel"] = measure(quiet(roster_whole), scale["roster_rows"], repeat)
+
+    # calc_ratios
+    frame = make_faculty_frame(scale["ratio_rows"])
+    results["calc_ratios"] = measure(lambda: calc_ratios(frame), scale["ratio_rows"], repeat)
+    peers = make_peer_frame(scale["ratio_rows"])
+    results["calc_ratios_batch"] = measure(lambda: calc_ratios_batch(peers), len(peers), repeat)
+
+    # update_criteria startup: interpreter + imports up to argument parsing
+    # (parsers and pandas are imported only once a data source is parsed)
+    def startup():
+        subprocess.run([sys.executable, str(REPO_ROOT / "scripts" / "update_criteria.py"), "--help"],
+                       cwd=REPO_ROOT, check=True, stdout=subprocess.DEVNULL)
+    results["update_criteria.startup"] = measure(startup, 1, repeat)
+
+    # update_markdown_block: one call per block vs one batch call
+    updates = {f"B{i}": f"| {i} | 값 |" for i in range(scale["blocks"])}
+    def per_block():
+        make_report(fixtures["report"], scale["blocks"])
+        for block_id, content in updates.items():
+            update_markdown_block(fixtures["report"], block_id, content)
+    def batch():
+        make_report(fixtures["report"], scale["blocks"])
+        update_markdown_blocks(fixtures["report"], updates)
+    results["update_markdown_block.per_block"] = measure(quiet(per_block), scale["blocks"], repeat)
+    results["update_markdown_blocks.batch"] = measure(quiet(batch), scale["blocks"], repeat)
+
+    return results
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Returns the benchmarks whose median exceeds the baseline by more than
+    `tolerance` and MIN_DELTA_S, when measured on at least MIN_REPEAT runs.
+    """
+    regressions = []
+    print(f"\n{'benchmark':36} {'seconds':>9} {'baseline':>9} {'change':>8} {'items/s':>11} {'peak MB':>8}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base:
+            change = r["seconds"] / base["seconds"] - 1 if base["seconds"] else 0.0
+            slower = change > tolerance and r["seconds"] - base["seconds"] > MIN_DELTA_S
+            flag = ""
+            if slower and r["repeat"] >= MIN_REPEAT:
+                flag = "  REGRESSION"
+                regressions.append(name)
+            elif slower:
+                flag = "  slower?"
+            print(f"{name:36} {r['seconds']:9.4f} {base['seconds']:9.4f} {change:+8.0%} "
+                  f"{r['throughput']:11.1f} {r['peak_mb']:8.2f}{flag}")
+        else:
+            print(f"{name:36} {r['seconds']:9.4f} {'-':>9} {'-':>8} "
+                  f"{r['throughput']:11.1f} {r['peak_mb']:8.2f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true", help="Use small fixtures")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown vs the baseline (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    scale_name = "quick" if args.quick else "full"
+    results = run_benchmarks(SCALES[scale_name], args.repeat)
+    if args.repeat < MIN_REPEAT:
+        print(f"\nNote: fewer than {MIN_REPEAT} repeats; slowdowns are shown but not checked.")
+
+    stored = json.loads(BASELINE_PATH.read_text(encoding="utf-8")) if BASELINE_PATH.exists() else {}
+    regressions = compare(results, stored.get(scale_name, {}), args.tolerance)
+
+    if args.save_baseline:
+        stored[scale_name] = results
+        BASELINE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        BASELINE_PATH.write_text(json.dumps(stored, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"\nSaved {scale_name} baseline to {BASELINE_PATH}")
+    elif regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+Incremental build of the report pipeline as a dependency graph.
+
+Nodes:
+    extract:* / calc:*   script steps (PDF -> CSV/text, CSV -> 3.1 ratio tables)
+    source:<id>/<src>    one data source of criteria/<id>/config.yml -> metrics store
+    render:<id>          stored sources + LLM blocks -> report/<id> *.md
+
+A node is rebuilt when the content hash of one of its inputs changed or an
+upstream node produced different output; everything else is skipped.
+Independent nodes run in parallel.
+
+Usage:
+    python scripts/build.py                         # rebuild whatever is stale
+    python scripts/build.py --changed $(git diff --name-only HEAD~1)
+    git diff --name-only HEAD~1 | python scripts/build.py --changed -
+    python scripts/build.py --dry-run               # only list what would run
+    python scripts/build.py --exclude extract:3.1-pdf
+"""
+import os
+import sys
+import glob
+import json
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from cache_utils import file_hash, read_json, write_json
+import instrument
+from instrument import stage
+
+# --- Configuration ---
+REPO_ROOT = Path(os.getcwd())
+STATE_PATH = REPO_ROOT / ".cache" / "build" / "state.json"
+
+# Script steps that are not described by a config.yml. Inputs may be globs;
+# edges between nodes follow from one node's outputs being another's inputs
+# (plus explicit "deps" for steps writing into the same file).
+SCRIPT_STEPS = [
+    {
+        "id": "extract:3.1-pdf",
+        "command": ["scripts/extract_3_1_from_pdf.py"],
+        "inputs": ["data/raw/3.1/*.pdf", "criteria/3.1/pdf_table_template.json",
+                   "scripts/extract_3_1_from_pdf.py", "scripts/pdf_cache.py"],
+        "outputs": ["data/4th-cycle/3.1/faculty_numbers_2021_2025.csv"],
+    },
+    {
+        "id": "extract:3rd-cycle",
+        "command": ["scripts/extract_3rd_cycle.py"],
+        "inputs": ["3주기 - 대학자체진단평가보고서_ 교원 및 직원.pdf",
+                   "scripts/extract_3rd_cycle.py", "scripts/pdf_cache.py"],
+        "outputs": ["temp_3rd_cycle_content.txt"],
+    },
+    {
+        "id": "extract:3rd-cycle-docx",
+        "command": ["scripts/extract_3rd_cycle_docx.py"],
+        "inputs": ["3주기 - 대학자체진단평가보고서_ 교원 및 직원.docx", "scripts/extract_3rd_cycle_docx.py"],
+        "outputs": ["3rd_cycle_extracted.txt"],
+    },
+    {
+        "id": "calc:3.1-ratio",
+        "command": ["scripts/update_3_1.py"],
+        "inputs": ["data/4th-cycle/3.1/faculty_numbers_2021_2025.csv",
+                   "scripts/prompts/3.1_analysis.txt", "scripts/prompts/3.1_improvement.txt",
+                   "scripts/update_3_1.py", "scripts/table_renderer.py", "scripts/renderer.py",
+                   "scripts/metrics_store.py", "scripts/llm_blocks.py"],
+        "outputs": ["criteria/3.1-교원-확보-및-구성/3.1-교원-확보-및-구성.md"],
+    },
+    {
+        "id": "calc:3.1-hiring-plan",
+        "command": ["scripts/whatif_3_1.py"],
+        "inputs": ["data/4th-cycle/3.1/faculty_numbers_2021_2025.csv",
+                   "scripts/whatif_3_1.py", "scripts/update_3_1.py", "scripts/table_renderer.py",
+                   "scripts/renderer.py", "scripts/metrics_store.py"],
+        "outputs": ["criteria/3.1-교원-확보-및-구성/3.1-교원-확보-및-구성.md"],
+        # Writes into the report calc:3.1-ratio writes; run after it, never alongside
+        "deps": ["calc:3.1-ratio"],
+    },
+]
+
+# Code every source / render node depends on (plus the modules of its parsers)
+SOURCE_CODE = ["scripts/excel_cache.py", "scripts/metrics_store.py"]
+RENDER_CODE = ["scripts/update_criteria.py", "scripts/parser_registry.py", "scripts/table_renderer.py",
+               "scripts/renderer.py", "scripts/llm_blocks.py", "scripts/metrics_store.py"]
+
+def rel(path) -> str:
+    """
+    Repo-relative POSIX path, the form `git diff --name-only` prints.
+    """
+    return Path(os.path.relpath(os.path.abspath(path), REPO_ROOT)).as_posix()
+
+def expand(patterns) -> list[str]:
+    """
+    Expands glob patterns; plain paths are kept even if they do not exist yet.
+    """
+    paths = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths.extend(rel(p) for p in sorted(glob.glob(pattern)))
+        else:
+            paths.append(rel(pattern))
+    return paths
+
+# --- Graph ---
+def build_graph(exclude=()) -> dict:
+    """
+    Returns {node_id: node}. A node has inputs (files), outputs (files),
+    deps (node ids), watch (input patterns, for --changed) and run().
+    Excluded nodes are left out; their outputs become plain input files.
+    """
+    import parser_registry
+    import update_criteria
+
+    nodes = {}
+    for step in SCRIPT_STEPS:
+        nodes[step["id"]] = {
+            "inputs": expand(step["inputs"]),
+            "watch": step["inputs"],
+            "outputs": expand(step["outputs"]),
+            "deps": step.get("deps", []),
+            "run": lambda step=step: run_script(step["command"]),
+        }
+
+    for cid in update_criteria.discover_criteria():
+        config_path = f"criteria/{cid}/config.yml"
+        config = update_criteria.load_config(cid)
+        source_nodes, parser_code = [], []
+        for source in config.get("data_sources", []):
+            if not parser_registry.is_available(source):
+                continue
+            node_id = f"source:{cid}/{source['id']}"
+            files = [rel(f) for f in update_criteria.source_files(cid, source)]
+            # Located without importing, so the graph builds without pandas
+            parse_code = rel(parser_registry.module_file(parser_registry.parser_ref(source)))
+            render_code = parser_registry.module_file(parser_registry.renderer_ref(source))
+            parser_code.extend([parse_code] + ([rel(render_code)] if render_code else []))
+            nodes[node_id] = {
+                "inputs": files + [config_path] + SOURCE_CODE + [parse_code],
+                "outputs": [],
+                "run": lambda cid=cid, source=source: run_source(cid, source),
+            }
+            source_nodes.append(node_id)
+
+        templates = [rel(os.path.join("criteria", cid, b["prompt_template"]))
+                     for b in config.get("llm_blocks", [])]
+        report = update_criteria.resolve_report_path(cid, config)
+        nodes[f"render:{cid}"] = {
+            "inputs": [config_path] + templates + RENDER_CODE + sorted(set(parser_code)),
+            "outputs": [rel(report)] if report else [],
+            "deps": source_nodes,
+            "run": lambda cid=cid: update_criteria.process_criterion(cid, parse=False),
+        }
+
+    unknown = set(exclude) - set(nodes)
+    if unknown:
+        raise ValueError(f"Unknown node(s): {', '.join(sorted(unknown))}")
+    for node_id in exclude:
+        del nodes[node_id]
+    for node in nodes.values():
+        node["deps"] = [d for d in node.get("deps", []) if d not in exclude]
+
+    # File edges: a node depends on the producer of any of its inputs (the
+    # first one when several steps write the same file)
+    producers = {}
+    for node_id, node in nodes.items():
+        for out in node["outputs"]:
+            producers.setdefault(out, node_id)
+    for node_id, node in nodes.items():
+        deps = set(node.get("deps", []))
+        deps.update(producers[p] for p in node["inputs"] if p in producers and producers[p] != node_id)
+        node["deps"] = sorted(deps)
+    return nodes
+
+def run_script(command):
+    subprocess.run([sys.executable, *command], cwd=REPO_ROOT, check=True)
+
+def run_source(criterion_id, source):
+    import metrics_store
+    import update_criteria
+    conn = metrics_store.connect()
+    try:
+        update_criteria.parse_source(conn, criterion_id, source)
+    finally:
+        conn.close()
+
+def topo_order(nodes: dict) -> list[str]:
+    order, visiting, done = [], set(), set()
+    def visit(node_id):
+        if node_id in done:
+            return
+        if node_id in visiting:
+            raise ValueError(f"Dependency cycle at {node_id}")
+        visiting.add(node_id)
+        for dep in nodes[node_id]["deps"]:
+            visit(dep)
+        visiting.discard(node_id)
+        done.add(node_id)
+        order.append(node_id)
+    for node_id in sorted(nodes):
+        visit(node_id)
+    return order
+
+def affected_by(nodes: dict, changed: list[str]) -> set[str]:
+    """
+    Nodes with a changed path among their inputs (or input globs), plus
+    everything downstream of them.
+    """
+    changed = {rel(p) for p in changed}
+    hit = set()
+    for node_id, node in nodes.items():
+        patterns = node.get("watch", [])
+        if changed & set(node["inputs"]) or any(
+                Path(p).match(pattern) for p in changed for pattern in patterns):
+            hit.add(node_id)
+    for node_id in topo_order(nodes):
+        if any(dep in hit for dep in nodes[node_id]["deps"]):
+            hit.add(node_id)
+    return hit
+
+# --- Freshness ---
+class Hasher:
+    """
+    Content hashes of files, reusing the previous hash while mtime and size
+    are unchanged so a no-op build does not re-read every input.
+    """
+    def __init__(self, known: dict):
+        self.known = known
+
+    def __call__(self, path: str) -> str | None:
+        try:
+            st = os.stat(REPO_ROOT / path)
+        except OSError:
+            return None
+        entry = self.known.get(path)
+        if entry and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            return entry["sha"]
+        sha = file_hash(REPO_ROOT / path)
+        self.known[path] = {"mtime": st.st_mtime_ns, "size": st.st_size, "sha": sha}
+        return sha
+
+def node_stamp(node_id: str, node: dict, hasher: Hasher) -> str:
+    """
+    Fingerprint of what a node produced: its output files, or for source
+    nodes the records stored for that source.
+    """
+    if node_id.startswith("source:"):
+        import metrics_store
+        criterion, source = node_id[len("source:"):].split("/", 1)
+        conn = metrics_store.connect()
+        try:
+            rows = conn.execute(
+                "SELECT year, basis, seq, metric, value, text FROM metrics "
+                "WHERE criterion = ? AND source = ? ORDER BY year, basis, seq, metric",
+                (criterion, source)).fetchall()
+        finally:
+            conn.close()
+        payload = json.dumps(rows, ensure_ascii=False)
+    else:
+        payload = json.dumps([hasher(p) for p in node["outputs"]])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def build(changed: list[str] | None = None, jobs: int = 4, force: bool = False,
+          dry_run: bool = False, exclude=()) -> dict:
+    """
+    Rebuilds stale nodes. With `changed`, only nodes affected by those paths
+    are considered. Returns {node_id: "built" | "fresh" | "failed" | "skipped"}.
+    """
+    nodes = build_graph(exclude)
+    state = read_json(STATE_PATH) or {}
+    hasher = Hasher(state.setdefault("files", {}))
+    recorded = state.setdefault("nodes", {})
+    candidates = affected_by(nodes, changed) if changed is not None else set(nodes)
+
+    status = {}
+    stamps = {node_id: recorded.get(node_id, {}).get("stamp") for node_id in nodes}
+
+    def signature(node_id):
+        node = nodes[node_id]
+        return {"inputs": {p: hasher(p) for p in node["inputs"]},
+                "deps": {d: stamps[d] for d in node["deps"]}}
+
+    def is_stale(node_id, sig):
+        if force:
+            return True
+        previous = recorded.get(node_id)
+        if not previous or previous.get("inputs") != sig["inputs"] or previous.get("deps") != sig["deps"]:
+            return True
+        if node_id.startswith("source:"):
+            # The metrics store is not part of the build state (e.g. a CI cache
+            # restoring .cache/build without metrics/metrics.db): the records
+            # must still be the ones this node stored
+            return node_stamp(node_id, nodes[node_id], hasher) != previous.get("stamp")
+        return any(not (REPO_ROOT / p).exists() for p in nodes[node_id]["outputs"])
+
+    def execute(node_id, sig):
+        with stage("build_node", node=node_id):
+            nodes[node_id]["run"]()
+        return node_id, sig
+
+    pending = [n for n in topo_order(nodes) if n in candidates]
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while pending or running:
+            # Submit every node whose upstream nodes are settled: a node's
+            # signature includes its deps' stamps, which are final only then
+            for node_id in list(pending):
+                deps = nodes[node_id]["deps"]
+                running_ids = set(running.values())
+                if any(d in running_ids or d in pending for d in deps):
+                    continue
+                pending.remove(node_id)
+                if any(status.get(d) in ("failed", "skipped") for d in deps):
+                    status[node_id] = "skipped"
+                    continue
+                if dry_run and any(status.get(d) == "stale" for d in deps):
+                    status[node_id] = "stale"
+                    continue
+                sig = signature(node_id)
+                if not is_stale(node_id, sig):
+                    status[node_id] = "fresh"
+                    continue
+                if dry_run:
+                    status[node_id] = "stale"
+                    continue
+                print(f"[build] {node_id}")
+                running[pool.submit(execute, node_id, sig)] = node_id
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node_id = running.pop(future)
+                try:
+                    _, sig = future.result()
+                except Exception as e:
+                    print(f"[ERROR] {node_id} failed: {e}")
+                    status[node_id] = "failed"
+                    recorded.pop(node_id, None)
+                    continue
+                stamps[node_id] = node_stamp(node_id, nodes[node_id], hasher)
+                recorded[node_id] = {**sig, "stamp": stamps[node_id]}
+                status[node_id] = "built"
+
+    if not dry_run:
+        STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        write_json(STATE_PATH, state)
+    return status
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental build of the report pipeline")
+    parser.add_argument("--changed", nargs="*", metavar="PATH",
+                        help="Only rebuild what these paths affect ('-' reads them from stdin)")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="Nodes run in parallel")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if fresh")
+    parser.add_argument("--dry-run", action="store_true", help="Only report stale nodes")
+    parser.add_argument("--graph", action="store_true", help="Print the dependency graph")
+    parser.add_argument("--exclude", action="append", default=[], metavar="NODE",
+                        help="Leave a node out of the build (repeatable)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record per-node timings into metrics/stages/build.json")
+    args = parser.parse_args()
+    if args.profile:
+        instrument.enable()
+
+    try:
+        nodes = build_graph(args.exclude)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.graph:
+        for node_id in topo_order(nodes):
+            deps = ", ".join(nodes[node_id]["deps"]) or "-"
+            print(f"{node_id}  <-  {deps}")
+        return
+
+    changed = args.changed
+    if changed == ["-"]:
+        changed = [line.strip() for line in sys.stdin if line.strip()]
+
+    status = build(changed, args.jobs, args.force, args.dry_run, args.exclude)
+    print("\n=== Build ===")
+    for node_id, result in status.items():
+        print(f"  {result:8} {node_id}")
+    if instrument.ENABLED:
+        instrument.merge_stages(instrument.stages_path("build"), "build", instrument.records())
+    if "failed" in status.values():
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+
+def file_hash(path) -> str:
+    """
+    Returns the SHA-256 of the file contents (used as the cache key).
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def write_json(path: Path, data):
+    # Write to a temp file first so a crash never leaves a half-written entry
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def read_json(path: Path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
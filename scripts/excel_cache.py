@@ -0,0 +1,350 @@
+import os
+import re
+import time
+import struct
+import zipfile
+import tempfile
+import functools
+import hashlib
+import argparse
+import xml.etree.ElementTree as ET
+from pathlib import Path
+import pandas as pd
+from cache_utils import file_hash, read_json, write_json
+
+try:
+    import pyarrow  # noqa: F401  (enables the Parquet sidecars)
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# --- Configuration ---
+REPO_ROOT = Path(os.getcwd())
+CACHE_DIR = REPO_ROOT / ".cache" / "excel"
+
+def _sidecar_base(file_path: Path, sheet_name) -> Path:
+    # One sidecar per (workbook path, sheet); the path hash keeps same-named files apart
+    path_key = hashlib.sha1(str(file_path.resolve()).encode("utf-8")).hexdigest()[:10]
+    return CACHE_DIR / f"{file_path.stem}-{path_key}-{sheet_name}"
+
+def _is_fresh(file_path: Path, meta: dict | None) -> bool:
+    """
+    A sidecar is fresh if the workbook's mtime/size are unchanged, or if they
+    changed but the contents still hash the same (e.g. after a git checkout).
+    """
+    if not meta:
+        return False
+    stat = file_path.stat()
+    if meta["mtime"] == stat.st_mtime and meta["size"] == stat.st_size:
+        return True
+    if meta["hash"] != file_hash(file_path):
+        return False
+    meta["mtime"], meta["size"] = stat.st_mtime, stat.st_size
+    return True
+
+def _write_sidecar(df: pd.DataFrame, base: Path) -> str:
+    if HAS_PARQUET:
+        try:
+            df.to_parquet(base.with_suffix(".parquet"), index=False)
+            return "parquet"
+        except Exception:
+            # Mixed-type object columns cannot be stored in Parquet
+            pass
+    df.to_pickle(base.with_suffix(".pkl"))
+    return "pickle"
+
+def _read_sidecar(base: Path, fmt: str, columns: list[str] | None) -> pd.DataFrame:
+    if fmt == "parquet":
+        return pd.read_parquet(base.with_suffix(".parquet"), columns=columns)
+    df = pd.read_pickle(base.with_suffix(".pkl"))
+    return df[columns] if columns is not None else df
+
+def read_excel_cached(file_path, columns: list[str] | None = None,
+                      sheet_name=0) -> pd.DataFrame:
+    """
+    Drop-in for pd.read_excel(file_path, sheet_name=sheet_name) backed by a
+    columnar sidecar in .cache/excel. The workbook is only parsed with openpyxl
+    when the sidecar is missing or stale. If columns is given, only those
+    columns are read (columns absent from the sheet are skipped).
+    """
+    file_path = Path(file_path)
+    base = _sidecar_base(file_path, sheet_name)
+    meta_path = base.with_suffix(".json")
+    meta = read_json(meta_path)
+    old_mtime = meta["mtime"] if meta else None
+
+    if _is_fresh(file_path, meta):
+        if meta["mtime"] != old_mtime:
+            write_json(meta_path, meta)
+    else:
+        df = pd.read_excel(file_path, sheet_name=sheet_name)
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        stat = file_path.stat()
+        meta = {
+            "source": str(file_path),
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "hash": file_hash(file_path),
+            "format": _write_sidecar(df, base),
+            "columns": [str(c) for c in df.columns],
+        }
+        write_json(meta_path, meta)
+        if columns is None:
+            return df
+        return df[[c for c in columns if c in df.columns]]
+
+    if columns is not None:
+        columns = [c for c in columns if c in meta["columns"]]
+    return _read_sidecar(base, meta["format"], columns)
+
+# --- Streaming ---
+# For inputs too large to load (and cache) whole, e.g. an HR roster export:
+# rows are read straight from the sheet XML and handed out in bounded chunks.
+SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+DIGITS = "0123456789"
+
+def _sheet_path(zf: zipfile.ZipFile, sheet_name) -> str:
+    """
+    Zip member of a worksheet given by position or name.
+    """
+    sheets = ET.fromstring(zf.read("xl/workbook.xml")).find(SHEET_NS + "sheets")
+    if isinstance(sheet_name, int):
+        sheet = sheets[sheet_name]
+    else:
+        sheet = next((s for s in sheets if s.get("name") == sheet_name), None)
+        if sheet is None:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    target = next(r.get("Target") for r in rels.iter(PKG_REL_NS + "Relationship")
+                  if r.get("Id") == sheet.get(REL_NS + "id"))
+    return target.lstrip("/") if target.startswith("/") else "xl/" + target
+
+class _SharedStringsTarget:
+    """
+    XMLParser target that appends each shared string to a data file and its
+    end offset to an index file, so neither is held in memory.
+    """
+    def __init__(self, strings, offsets):
+        self.strings, self.offsets = strings, offsets
+        self.offset, self.parts = 0, []
+        self.capture = self.phonetic = False
+
+    def start(self, tag, attrib):
+        if tag == SHEET_NS + "si":
+            self.parts = []
+        elif tag == SHEET_NS + "rPh":
+            self.phonetic = True
+        elif tag == SHEET_NS + "t" and not self.phonetic:
+            # Rich text is split into runs; phonetic hints (rPh) are not part of the value
+            self.capture = True
+
+    def data(self, data):
+        if self.capture:
+            self.parts.append(data)
+
+    def end(self, tag):
+        if tag == SHEET_NS + "si":
+            self.offset += self.strings.write("".join(self.parts).encode("utf-8"))
+            self.offsets.write(struct.pack("<Q", self.offset))
+        elif tag == SHEET_NS + "rPh":
+            self.phonetic = False
+        elif tag == SHEET_NS + "t":
+            self.capture = False
+
+    def close(self):
+        pass
+
+class _SharedStrings:
+    """
+    The workbook's shared-string table spilled to temporary files and looked
+    up by position, so a roster with millions of unique strings (names,
+    employee ids) does not grow the reader's memory. Recently used strings
+    are kept in a small LRU cache.
+    """
+    def __init__(self, zf: zipfile.ZipFile, block_size: int = 1 << 20, cache_size: int = 4096):
+        self.strings, self.offsets = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+        self.offsets.write(struct.pack("<Q", 0))
+        if "xl/sharedStrings.xml" in zf.namelist():
+            parser = ET.XMLParser(target=_SharedStringsTarget(self.strings, self.offsets))
+            with zf.open("xl/sharedStrings.xml") as xml:
+                while block := xml.read(block_size):
+                    parser.feed(block)
+            parser.close()
+        self.lookup = functools.lru_cache(maxsize=cache_size)(self._read)
+
+    def _read(self, i: int) -> str:
+        self.offsets.seek(8 * i)
+        start, end = struct.unpack("<QQ", self.offsets.read(16))
+        self.strings.seek(start)
+        return self.strings.read(end - start).decode("utf-8")
+
+    def __getitem__(self, i: int) -> str:
+        return self.lookup(i)
+
+    def close(self):
+        self.strings.close()
+        self.offsets.close()
+
+def _column_letters(index: int) -> str:
+    letters, index = "", index + 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+def _column_index(letters: str) -> int:
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - 64
+    return index - 1
+
+def _cell_value(kind: str, text: str | None, shared: _SharedStrings):
+    if text is None or kind == "e":
+        return None
+    if kind == "s":
+        return shared[int(text)]
+    if kind in ("inlineStr", "str", "d"):
+        return text
+    if kind == "b":
+        return text == "1"
+    number = float(text)
+    return int(number) if number.is_integer() else number
+
+class _SheetRows:
+    """
+    XMLParser target that collects each <row> as a list of (reference, type,
+    raw text) cells without building an element tree.
+    """
+    def __init__(self):
+        self.rows, self.row, self.text = [], [], None
+        self.ref = self.kind = None
+        self.capture = self.phonetic = False
+
+    def start(self, tag, attrib):
+        if tag == SHEET_NS + "c":
+            self.ref, self.kind, self.text = attrib.get("r"), attrib.get("t", "n"), None
+        elif tag == SHEET_NS + "rPh":
+            self.phonetic = True
+        elif tag in (SHEET_NS + "v", SHEET_NS + "t") and not self.phonetic:
+            self.capture = True
+            self.text = self.text or ""
+
+    def data(self, data):
+        if self.capture:
+            self.text += data
+
+    def end(self, tag):
+        if tag == SHEET_NS + "c":
+            self.row.append((self.ref, self.kind, self.text))
+        elif tag == SHEET_NS + "row":
+            self.rows.append(self.row)
+            self.row = []
+        elif tag == SHEET_NS + "rPh":
+            self.phonetic = False
+        else:
+            self.capture = False
+
+    def close(self):
+        pass
+
+def _iter_sheet_rows(file_path, sheet_name, block_size: int = 1 << 20):
+    """
+    Yields (cells, shared strings) per row while streaming the sheet XML in
+    blocks, so only the rows of one block are held at a time. Dates stay
+    Excel serial numbers (the cell styles are not read).
+    """
+    with zipfile.ZipFile(file_path) as zf:
+        shared = _SharedStrings(zf, block_size)
+        try:
+            with zf.open(_sheet_path(zf, sheet_name)) as xml:
+                target = _SheetRows()
+                parser = ET.XMLParser(target=target)
+                while block := xml.read(block_size):
+                    parser.feed(block)
+                    for row in target.rows:
+                        yield row, shared
+                    target.rows.clear()
+                parser.close()
+                for row in target.rows:
+                    yield row, shared
+        finally:
+            shared.close()
+
+def _row_values(row, shared: _SharedStrings) -> list:
+    values = []
+    for ref, kind, text in row:
+        if ref:
+            values.extend([None] * (_column_index(ref.rstrip(DIGITS)) - len(values)))
+        values.append(_cell_value(kind, text, shared))
+    return values
+
+def read_excel_chunks(file_path, columns: list[str], chunk_rows: int = 50_000, sheet_name=0):
+    """
+    Reads the given columns of a large .xlsx (or .csv) in DataFrames of at most
+    chunk_rows rows, so memory stays bounded by the chunk size rather than by
+    the number of rows (shared strings are spilled to disk). The
+    first row is the header; missing columns raise ValueError.
+    Only the cells of the requested columns are decoded.
+    """
+    file_path = Path(file_path)
+    if file_path.suffix.lower() == ".csv":
+        yield from pd.read_csv(file_path, usecols=columns, chunksize=chunk_rows)
+        return
+
+    rows = _iter_sheet_rows(file_path, sheet_name)
+    first = next(rows, None)
+    header = [str(h).strip() if h is not None else "" for h in (_row_values(*first) if first else [])]
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise ValueError(f"Columns not found in {file_path.name}: {missing}")
+    indices = [header.index(c) for c in columns]
+    # Column letters ("A", "AB", ...) of the wanted columns -> position in the chunk
+    wanted = {_column_letters(i): pos for pos, i in enumerate(indices)}
+
+    chunk = []
+    for row, shared in rows:
+        values = [None] * len(columns)
+        for ref, kind, text in row:
+            if ref is None:
+                # The writer omitted cell references: decode the row positionally
+                full = _row_values(row, shared)
+                values = [full[i] if i < len(full) else None for i in indices]
+                break
+            pos = wanted.get(ref.rstrip(DIGITS))
+            if pos is not None:
+                values[pos] = _cell_value(kind, text, shared)
+        chunk.append(values)
+        if len(chunk) == chunk_rows:
+            yield pd.DataFrame(chunk, columns=columns)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk, columns=columns)
+
+def timing_report(paths: list[Path], repeat: int = 5):
+    """
+    Prints cold (openpyxl) vs warm (sidecar) load times for each workbook.
+    """
+    for path in paths:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            pd.read_excel(path)
+        cold = (time.perf_counter() - start) / repeat
+
+        read_excel_cached(path)  # make sure the sidecar exists
+        start = time.perf_counter()
+        for _ in range(repeat):
+            read_excel_cached(path)
+        warm = (time.perf_counter() - start) / repeat
+
+        print(f"{path.name}: cold {cold * 1000:.1f} ms, warm {warm * 1000:.1f} ms "
+              f"({cold / warm:.1f}x)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Excel sidecar cache timing report")
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    timing_report(args.files, args.repeat)
@@ -1,14 +1,30 @@
 import re
 import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import pdfplumber
 import pandas as pd
+from pdf_cache import CACHE_DIR, CachedPdf, extract_raw_texts, file_hash
+import instrument
+from instrument import stage
 
 # --- Configuration ---
 # Use relative paths for portability
 REPO_ROOT = Path(os.getcwd())
 RAW_DIR = REPO_ROOT / "data" / "raw" / "3.1"
+# Keywords identifying the page with the target table
+TARGET_KEYWORDS = ("전임교원 1인당 학생 수", "전임교원 확보율")
 OUT_CSV = REPO_ROOT / "data" / "4th-cycle" / "3.1" / "faculty_numbers_2021_2025.csv"
+STAGES_PATH = REPO_ROOT / instrument.stages_path("3.1")
+# Learned table region and column mapping, reused across years
+TEMPLATE_PATH = REPO_ROOT / "criteria" / "3.1" / "pdf_table_template.json"
+TEMPLATE_PAD = 5  # points added around the learned table bbox
+# Row labels of the university-wide total row
+TOTAL_ROW_LABELS = ("전체", "합계")
+# Records which PDF contents have already been merged into OUT_CSV
+MANIFEST_PATH = CACHE_DIR / "3.1_manifest.json"
 
 def extract_year_from_filename(path: Path) -> int:
     # Example: "2021 정보공시.pdf" -> 2021
@@ -18,6 +34,20 @@ def extract_year_from_filename(path: Path) -> int:
         return 0
     return int(m.group())
 
+def find_candidate_pages(raw_texts: list[str]) -> list[int]:
+    """
+    Cheap first pass: returns the pages whose raw text layer contains all
+    TARGET_KEYWORDS. Whitespace is ignored because the raw layer does not
+    reproduce the spacing of the laid-out text.
+    """
+    keywords = [re.sub(r"\s+", "", k) for k in TARGET_KEYWORDS]
+    candidates = []
+    for page_no, text in enumerate(raw_texts):
+        squashed = re.sub(r"\s+", "", text or "")
+        if all(k in squashed for k in keywords):
+            candidates.append(page_no)
+    return candidates
+
 def find_target_table(page) -> list[list[str]]:
     """
     Finds the table containing "Full-time Faculty Ratio" data.
@@ -25,63 +55,109 @@ def find_target_table(page) -> list[list[str]]:
     text = page.extract_text() or ""
     # Keywords to identify the correct page/table
     # Adjust these based on the actual PDF content
-    if "전임교원 1인당 학생 수" in text and "전임교원 확보율" in text:
+    if all(k in text for k in TARGET_KEYWORDS):
         tables = page.extract_tables()
         if tables:
             return tables[0]  # Assuming the first table is the target
     return None
 
-def parse_table_to_rows(year: int, table: list[list[str]]) -> list[dict]:
+def to_int(x) -> int:
+    if x is None: return 0
+    clean_x = re.sub(r"[^\d]", "", str(x))
+    return int(clean_x) if clean_x else 0
+
+def count_header_rows(table: list[list[str]]) -> int:
     """
-    Parses the extracted table into structured rows.
+    Number of header rows: rows before the first row that is mostly numeric.
+    정보공시 tables use 3 stacked header rows, simple tables use 1.
     """
-    if not table:
-        return []
+    for idx, row in enumerate(table):
+        cells = [c for c in row if c not in (None, "")]
+        numeric = [c for c in cells if re.fullmatch(r"[\d,.\s%-]+", str(c))]
+        if cells and len(numeric) * 2 >= len(cells):
+            return max(idx, 1)
+    return 1
 
-    header = table[0]
-    rows = table[1:]
-    result = []
+def combine_header(table: list[list[str]], header_rows: int) -> list[str]:
+    """
+    Flattens stacked header rows into one label per column.
+    Merged cells in the top row (None) inherit the label to their left.
+    """
+    width = max(len(row) for row in table[:header_rows])
+    labels = [""] * width
+    group = ""
+    for idx in range(width):
+        parts = []
+        for level, row in enumerate(table[:header_rows]):
+            cell = row[idx] if idx < len(row) else None
+            if level == 0:
+                group = str(cell) if cell is not None else group
+                cell = group
+            if cell:
+                parts.append(str(cell).replace("\n", ""))
+        labels[idx] = " ".join(parts)
+    return labels
 
-    # Map column indices based on header names
+def map_columns(labels: list[str]) -> dict:
+    """
+    Maps the CSV fields to column indices from the flattened header labels.
+    The first matching column wins.
+    """
     col_map = {}
-    for idx, col in enumerate(header):
-        col_str = str(col).replace("\n", "")
-        if "전임교원" in col_str and "계" in col_str: # Assuming 'Total' column for Full-time
-             col_map["전임교원수A"] = idx
+    for idx, col_str in enumerate(labels):
+        if "전임교원 현황" in col_str and "재학생" in col_str: # Full-time, enrolled basis
+             col_map.setdefault("전임교원수A_재학생", idx)
+        elif "전임교원" in col_str and ("계" in col_str or "현황" in col_str): # Full-time total
+             col_map.setdefault("전임교원수A", idx)
         elif "겸임교원" in col_str:
-             col_map["겸임교원수"] = idx
+             col_map.setdefault("겸임교원수", idx)
         elif "법정정원" in col_str and "학생정원" in col_str:
-             col_map["법정정원_학생정원"] = idx
+             col_map.setdefault("법정정원_학생정원", idx)
         elif "법정정원" in col_str and "재학생" in col_str:
-             col_map["법정정원_재학생"] = idx
-    
-    # Fallback if column mapping fails (for testing with dummy data)
-    if not col_map:
-        # print("[DEBUG] Column mapping failed. Using default indices for testing.")
-        # This is risky but useful if headers are complex. 
-        # For now, let's try to be strict or provide a default if it looks like a standard table
-        pass
+             col_map.setdefault("법정정원_재학생", idx)
+    return col_map
+
+def parse_table_to_rows(year: int, table: list[list[str]],
+                        col_map: dict | None = None,
+                        header_rows: int | None = None) -> list[dict]:
+    """
+    Parses the extracted table into structured rows.
+    col_map/header_rows come from a layout template when one matched;
+    otherwise they are detected from the table header. Fields without a
+    mapped column are left as None (not 0) so merge_rows keeps the CSV's value.
+    """
+    if not table:
+        return []
+
+    if header_rows is None:
+        header_rows = count_header_rows(table)
+    if col_map is None:
+        col_map = map_columns(combine_header(table, header_rows))
+
+    rows = table[header_rows:]
+    result = []
+
+    if "전임교원수A" not in col_map or not (
+            "법정정원_학생정원" in col_map or "법정정원_재학생" in col_map):
+        print(f"[WARN] Could not map table columns for {year}: {col_map}")
+        return []
 
     for row in rows:
-        # Look for the "Total" or "University" row
-        # Adjust "전체" to whatever the row label is in the PDF
-        if row[0] and "전체" in str(row[0]):
-            
-            def to_int(x):
-                if x is None: return 0
-                clean_x = re.sub(r"[^\d]", "", str(x))
-                return int(clean_x) if clean_x else 0
-
-            # Use mapped indices or defaults
-            idx_a = col_map.get("전임교원수A", 2) # Default index 2
-            idx_adj = col_map.get("겸임교원수", 3) # Default index 3
-            idx_b_std = col_map.get("법정정원_학생정원", 4) # Default index 4
-            idx_b_enr = col_map.get("법정정원_재학생", 5) # Default index 5
-
-            a = to_int(row[idx_a]) if len(row) > idx_a else 0
-            adjunct = to_int(row[idx_adj]) if len(row) > idx_adj else 0
-            b_student = to_int(row[idx_b_std]) if len(row) > idx_b_std else 0
-            b_enrolled = to_int(row[idx_b_enr]) if len(row) > idx_b_enr else 0
+        # Look for the "Total" row
+        label = re.sub(r"\s+", "", str(row[0] or ""))
+        if any(t in label for t in TOTAL_ROW_LABELS):
+
+            def cell(key):
+                idx = col_map.get(key)
+                return to_int(row[idx]) if idx is not None and len(row) > idx else None
+
+            a = cell("전임교원수A")
+            a_enrolled = cell("전임교원수A_재학생")
+            adjunct = cell("겸임교원수")
+            b_student = cell("법정정원_학생정원")
+            b_enrolled = cell("법정정원_재학생")
+            if a_enrolled is None:
+                a_enrolled = a
 
             if a and b_student:
                 result.append({
@@ -91,11 +167,11 @@ def parse_table_to_rows(year: int, table: list[list[str]]) -> list[dict]:
                     "겸임교원수": adjunct,
                     "교원법정정원B": b_student,
                 })
-            if a and b_enrolled:
+            if a_enrolled and b_enrolled:
                 result.append({
                     "연도": year,
                     "기준구분": "재학생",
-                    "전임교원수A": a,
+                    "전임교원수A": a_enrolled,
                     "겸임교원수": adjunct,
                     "교원법정정원B": b_enrolled,
                 })
@@ -103,49 +179,281 @@ def parse_table_to_rows(year: int, table: list[list[str]]) -> list[dict]:
 
     return result
 
+# --- Layout templates ---
+def load_template() -> dict | None:
+    try:
+        with open(TEMPLATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def learn_template(pdf_path: Path) -> dict | None:
+    """
+    Locates the target table in one PDF with the full-page scan and records
+    its bounding box, header and column mapping for reuse on later years.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        candidates = find_candidate_pages(extract_raw_texts(pdf_path))
+        for page_no in candidates:
+            page = pdf.pages[page_no]
+            if not all(k in (page.extract_text() or "") for k in TARGET_KEYWORDS):
+                continue
+            found = page.find_tables()
+            if not found:
+                continue
+            table = found[0].extract()
+            header_rows = count_header_rows(table)
+            col_map = map_columns(combine_header(table, header_rows))
+            # Pad the box a little so small shifts between years still fit
+            x0, top, x1, bottom = found[0].bbox
+            px0, ptop, px1, pbottom = page.bbox
+            bbox = [max(x0 - TEMPLATE_PAD, px0), max(top - TEMPLATE_PAD, ptop),
+                    min(x1 + TEMPLATE_PAD, px1), min(bottom + TEMPLATE_PAD, pbottom)]
+            return {
+                "source": pdf_path.name,
+                "bbox": [round(v, 2) for v in bbox],
+                "header_rows": header_rows,
+                "header": table[:header_rows],
+                "col_map": col_map,
+            }
+    return None
+
+def find_table_with_template(page, template: dict) -> list[list[str]] | None:
+    """
+    Extracts the table from the template's region only. Returns None when the
+    region holds no table with the learned header, so the caller can fall
+    back to the full-page scan.
+    """
+    try:
+        tables = page.crop(tuple(template["bbox"])).extract_tables()
+    except ValueError:
+        # The bbox does not fit this page (different page size)
+        return None
+    for table in tables:
+        if table[:template["header_rows"]] == template["header"]:
+            return table
+    return None
+
+def extract_rows_from_pdf(pdf_path: Path) -> tuple[list[dict], str | None]:
+    """
+    Extracts the 3.1 rows from a single PDF.
+    Returns (rows, error); errors are reported instead of raised so that
+    one broken file does not abort the other files in a batch.
+    """
+    year = extract_year_from_filename(pdf_path)
+    if year == 0:
+        return [], None
+
+    print(f"Processing {pdf_path.name}...")
+    try:
+        with stage("extract_pdf", source=pdf_path.name) as rec, CachedPdf(pdf_path) as pdf:
+            # Only run layout/table extraction on pages passing the prefilter
+            candidates = find_candidate_pages(pdf.raw_texts())
+            print(f"  Prefilter skipped {len(pdf.pages) - len(candidates)} of {len(pdf.pages)} pages")
+            rec["pages"] = len(pdf.pages)
+            rec["pages_scanned"] = 0
+
+            template = load_template()
+            for page_no in candidates:
+                page = pdf.pages[page_no]
+                rec["pages_scanned"] += 1
+                rows = None
+                if template:
+                    table = find_table_with_template(page, template)
+                    if table:
+                        rows = parse_table_to_rows(year, table, template["col_map"],
+                                                   template["header_rows"])
+                if not rows:
+                    table = find_target_table(page)
+                    if table:
+                        if template:
+                            print(f"  [WARN] Template did not match {pdf_path.name}, used full-page scan")
+                        rows = parse_table_to_rows(year, table)
+                # An empty parse (e.g. no total row) moves on to the next candidate page
+                if rows:
+                    rec["rows"] = len(rows)
+                    return rows, None
+
+            print(f"[WARN] Target table not found in {pdf_path.name}")
+            return [], None
+    except Exception as e:
+        return [], f"Failed to process {pdf_path.name}: {e}"
+
+def _extract_in_worker(pdf_path: Path, profile: bool):
+    # Stage records live in the worker process; ship them back with the result
+    if profile:
+        instrument.enable()
+    return extract_rows_from_pdf(pdf_path), instrument.drain()
+
+def extract_all(pdf_files: list[Path], workers: int = 1) -> tuple[list[dict], list[Path]]:
+    """
+    Extracts rows from all PDFs, optionally sharding files across a process pool.
+    Results are merged in file order so the output matches the serial path.
+    Returns (rows, unfinished_files): the files that failed or yielded no rows.
+    """
+    if workers > 1 and len(pdf_files) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pdf_files))) as pool:
+            results = []
+            for result, stage_records in pool.map(_extract_in_worker, pdf_files,
+                                                  [instrument.ENABLED] * len(pdf_files)):
+                results.append(result)
+                instrument.extend(stage_records)
+    else:
+        results = [extract_rows_from_pdf(p) for p in pdf_files]
+
+    all_rows = []
+    unfinished = []
+    for pdf_path, (rows, error) in zip(pdf_files, results):
+        if error:
+            print(f"[ERROR] {error}")
+        if error or not rows:
+            unfinished.append(pdf_path)
+            continue
+        all_rows.extend(rows)
+    return all_rows, unfinished
+
+def load_manifest() -> dict:
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest: dict):
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+def load_existing() -> pd.DataFrame | None:
+    if not OUT_CSV.exists():
+        return None
+    return pd.read_csv(OUT_CSV, encoding="utf-8-sig")
+
+def merge_rows(new_rows: list[dict], existing: pd.DataFrame | None,
+               full: bool = False) -> pd.DataFrame:
+    """
+    Replaces the rows of the extracted years in the existing CSV with new_rows
+    and keeps every other year as it is (with full=True only the extracted
+    rows are kept). Fields the PDF table does not have (None) keep the
+    existing CSV's value for the same year and basis.
+    """
+    keys = ["연도", "기준구분"]
+    new_df = pd.DataFrame(new_rows)
+    if existing is not None:
+        new_df = new_df.set_index(keys)
+        new_df = new_df.fillna(existing.set_index(keys).reindex(new_df.index)).reset_index()
+        if not full:
+            existing = existing[~existing["연도"].isin(new_df["연도"])]
+            new_df = pd.concat([existing, new_df], ignore_index=True)
+    for col in new_df.columns.drop(keys):
+        new_df[col] = new_df[col].astype("Int64")
+    # Sort by Year and Basis
+    return new_df.sort_values(keys, kind="stable")[list(new_df.columns)]
+
+def changed_values(df: pd.DataFrame, existing: pd.DataFrame | None) -> list[str]:
+    """
+    Describes every value of df that differs from the existing CSV for the
+    same year and basis. Rows the CSV does not have yet are not changes.
+    """
+    if existing is None:
+        return []
+    keys = ["연도", "기준구분"]
+    old = existing.set_index(keys)
+    changes = []
+    for _, row in df.iterrows():
+        key = (row["연도"], row["기준구분"])
+        if key not in old.index:
+            continue
+        for col in df.columns.drop(keys):
+            before = old.at[key, col] if col in old.columns else None
+            after = row[col]
+            if pd.isna(before) and pd.isna(after):
+                continue
+            if pd.isna(before) or pd.isna(after) or before != after:
+                changes.append(f"{key[0]} {key[1]} {col}: {before} -> {after}")
+    return changes
+
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (1 = serial)")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-parse every PDF and rebuild the CSV from scratch")
+    parser.add_argument("--force", action="store_true",
+                        help="Overwrite values that differ from the existing CSV")
+    parser.add_argument("--learn-template", type=Path, metavar="PDF",
+                        help="Learn the table layout template from this PDF and exit")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Record per-stage timings into {instrument.stages_path('3.1')}")
+    parser.add_argument("--trace", type=str, metavar="FILE",
+                        help="Also write a Chrome trace (implies --profile)")
+    args = parser.parse_args()
+    if args.profile or args.trace:
+        instrument.enable()
+
+    run(args)
+
+    if instrument.ENABLED:
+        instrument.merge_stages(STAGES_PATH, "extract_3_1_from_pdf", instrument.records())
+    if args.trace:
+        instrument.write_chrome_trace(args.trace)
+
+def run(args):
+    if args.learn_template:
+        template = learn_template(args.learn_template)
+        if template is None:
+            print(f"[ERROR] Target table not found in {args.learn_template.name}")
+            return
+        TEMPLATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(TEMPLATE_PATH, "w", encoding="utf-8") as f:
+            json.dump(template, f, indent=2, ensure_ascii=False)
+        print(f"Saved layout template to {TEMPLATE_PATH}")
+        return
+
     OUT_CSV.parent.mkdir(parents=True, exist_ok=True)
 
-    all_rows = []
     # Process all PDFs in the raw directory
-    pdf_files = list(RAW_DIR.glob("*.pdf"))
+    pdf_files = sorted(RAW_DIR.glob("*.pdf"))
     if not pdf_files:
         print(f"No PDF files found in {RAW_DIR}")
         return
 
-    for pdf_path in pdf_files:
-        year = extract_year_from_filename(pdf_path)
-        if year == 0: continue
-        
-        print(f"Processing {pdf_path.name}...")
-        try:
-            with pdfplumber.open(pdf_path) as pdf:
-                target_table = None
-                for page in pdf.pages:
-                    table = find_target_table(page)
-                    if table:
-                        target_table = table
-                        break
-                
-                if target_table is None:
-                    print(f"[WARN] Target table not found in {pdf_path.name}")
-                    continue
-
-                rows = parse_table_to_rows(year, target_table)
-                all_rows.extend(rows)
-        except Exception as e:
-            print(f"[ERROR] Failed to process {pdf_path.name}: {e}")
+    # Only parse files whose contents changed since the last merge
+    manifest = {} if args.full else load_manifest()
+    hashes = {p.name: file_hash(p) for p in pdf_files}
+    changed = [p for p in pdf_files if manifest.get(p.name) != hashes[p.name]]
+    if not changed:
+        print("All PDFs are up to date.")
+        return
+    print(f"{len(changed)} of {len(pdf_files)} PDF(s) changed.")
+
+    all_rows, unfinished = extract_all(changed, workers=args.workers)
 
     if not all_rows:
         print("No data extracted.")
         return
 
-    df = pd.DataFrame(all_rows)
-    # Sort by Year and Basis
-    df = df.sort_values(["연도", "기준구분"])
-    
-    df.to_csv(OUT_CSV, index=False, encoding="utf-8-sig")
+    with stage("write_csv", rows=len(all_rows)):
+        existing = load_existing()
+        df = merge_rows(all_rows, existing, full=args.full)
+
+        # The CSV feeds the published ratios; never change its values silently
+        changes = changed_values(df, existing)
+        if changes and not args.force:
+            print(f"[WARN] Extracted values differ from {OUT_CSV.name}; not overwriting it:")
+            for change in changes:
+                print(f"  {change}")
+            print("  Re-run with --force to accept the extracted values.")
+            return
+
+        df.to_csv(OUT_CSV, index=False, encoding="utf-8-sig")
     print(f"Successfully saved extracted data to {OUT_CSV}")
 
+    # Files without rows are retried on the next run
+    for p in changed:
+        if p not in unfinished:
+            manifest[p.name] = hashes[p.name]
+    save_manifest(manifest)
+
 if __name__ == "__main__":
     main()
@@ -1,37 +1,132 @@
-import pdfplumber
 import os
+import sys
+import argparse
+from cache_utils import read_json, write_json
+from pdf_cache import CachedPdf
+import instrument
+from instrument import stage
 
 PDF_PATH = "3주기 - 대학자체진단평가보고서_ 교원 및 직원.pdf"
 OUTPUT_TXT = "temp_3rd_cycle_content.txt"
+# Progress of an interrupted run: PDF hash, page range, next page, output size
+CHECKPOINT_PATH = OUTPUT_TXT + ".checkpoint.json"
+STAGES_PATH = instrument.stages_path("extract_3rd_cycle")
 
-def extract_content():
+def render_page(page_no: int, page) -> str:
+    """
+    Renders one page (text, then tables) in the temp_3rd_cycle_content.txt format.
+    """
+    parts = [f"--- Page {page_no} ---\n"]
+
+    # Extract Text
+    text = page.extract_text()
+    if text:
+        parts.append(text)
+        parts.append("\n\n")
+
+    # Extract Tables (Simple)
+    tables = page.extract_tables()
+    for table in tables:
+        parts.append("[TABLE START]\n")
+        for row in table:
+            # Clean None values
+            clean_row = [str(cell).replace('\n', ' ') if cell is not None else "" for cell in row]
+            parts.append(" | ".join(clean_row))
+            parts.append("\n")
+        parts.append("[TABLE END]\n\n")
+    return "".join(parts)
+
+def parse_page_range(spec: str | None) -> tuple[int, int | None]:
+    """
+    Parses a 1-based inclusive range such as "5-20", "5-" or "7" into
+    (first, last); last is None for an open end. An empty or malformed range
+    raises ValueError.
+    """
+    if not spec:
+        return 1, None
+    first, _, last = spec.partition("-")
+    try:
+        first = int(first) if first else 1
+        last = (int(last) if last else None) if "-" in spec else first
+    except ValueError:
+        raise ValueError(f'Invalid page range "{spec}"') from None
+    if first < 1:
+        raise ValueError(f'Invalid page range "{spec}": pages are numbered from 1')
+    if last is not None and first > last:
+        raise ValueError(f'Page range "{spec}" selects no pages')
+    return first, last
+
+def extract_content(pages: tuple[int, int | None] = (1, None), resume: bool = True):
+    """
+    Streams the PDF page by page into OUTPUT_TXT. Each page's resources are
+    released after it is written and progress is checkpointed, so an
+    interrupted run continues where it stopped. `pages` comes from
+    parse_page_range; its end is clipped to the last page.
+    """
     if not os.path.exists(PDF_PATH):
         print(f"File not found: {PDF_PATH}")
         return
 
-    with pdfplumber.open(PDF_PATH) as pdf:
-        with open(OUTPUT_TXT, "w", encoding="utf-8") as f:
-            for i, page in enumerate(pdf.pages):
-                f.write(f"--- Page {i+1} ---\n")
-                
-                # Extract Text
-                text = page.extract_text()
-                if text:
-                    f.write(text)
-                    f.write("\n\n")
-                
-                # Extract Tables (Simple)
-                tables = page.extract_tables()
-                for table in tables:
-                    f.write("[TABLE START]\n")
-                    for row in table:
-                        # Clean None values
-                        clean_row = [str(cell).replace('\n', ' ') if cell is not None else "" for cell in row]
-                        f.write(" | ".join(clean_row))
-                        f.write("\n")
-                    f.write("[TABLE END]\n\n")
+    # Pages are served from the on-disk cache when the PDF is unchanged
+    with stage("extract_3rd_cycle", source=os.path.basename(PDF_PATH)) as rec, CachedPdf(PDF_PATH) as pdf:
+        first, last = pages[0], min(pages[1] or len(pdf.pages), len(pdf.pages))
+        if first > last:
+            # Checked before OUTPUT_TXT and the checkpoint are touched
+            sys.exit(f"Page range starts at {first}, but the PDF has {len(pdf.pages)} pages")
+        start, offset = first, 0
+
+        checkpoint = read_json(CHECKPOINT_PATH) if resume else None
+        if (checkpoint and os.path.exists(OUTPUT_TXT)
+                and checkpoint["pdf_hash"] == pdf.hash
+                and checkpoint["range"] == [first, last]):
+            start, offset = checkpoint["next_page"], checkpoint["offset"]
+            print(f"Resuming from page {start}")
+        rec["pages"] = len(pdf.pages)
+        rec["pages_scanned"] = last - start + 1
 
+        # Binary mode so the checkpoint offset is an exact byte position
+        with open(OUTPUT_TXT, "r+b" if offset else "wb") as f:
+            f.truncate(offset)
+            f.seek(offset)
+            for page_no in range(start, last + 1):
+                page = pdf.pages[page_no - 1]
+                with stage("page", page=page_no):
+                    f.write(render_page(page_no, page).encode("utf-8"))
+                f.flush()
+                page.release()
+                write_json(CHECKPOINT_PATH, {
+                    "pdf_hash": pdf.hash,
+                    "range": [first, last],
+                    "next_page": page_no + 1,
+                    "offset": f.tell(),
+                })
+
+    if os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
     print(f"Extracted content to {OUTPUT_TXT}")
 
 if __name__ == "__main__":
-    extract_content()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=str, default=None,
+                        help='1-based page range, e.g. "5-20" (default: all pages)')
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore any checkpoint and start from the first page")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Record per-stage timings into {STAGES_PATH}")
+    parser.add_argument("--trace", type=str, metavar="FILE",
+                        help="Also write a Chrome trace (implies --profile)")
+    args = parser.parse_args()
+    if args.profile or args.trace:
+        instrument.enable()
+
+    try:
+        pages = parse_page_range(args.pages)
+    except ValueError as e:
+        parser.error(str(e))
+
+    extract_content(pages, resume=not args.restart)
+
+    if instrument.ENABLED:
+        instrument.merge_stages(STAGES_PATH, "extract_3rd_cycle", instrument.records())
+    if args.trace:
+        instrument.write_chrome_trace(args.trace)
@@ -1,39 +1,225 @@
-from docx import Document
 import os
+import sys
+import shutil
+import zipfile
+import argparse
+import tempfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
 
 DOCX_PATH = "3주기 - 대학자체진단평가보고서_ 교원 및 직원.docx"
 OUTPUT_TXT = "3rd_cycle_extracted.txt"
 
-def extract_content():
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+BODY, P, TBL, TR, TC = W + "body", W + "p", W + "tbl", W + "tr", W + "tc"
+RUN, HYPERLINK = W + "r", W + "hyperlink"
+# Run children that carry text, as python-docx's Run.text reads them
+RUN_TEXT = {W + "t": None, W + "tab": "\t", W + "ptab": "\t", W + "cr": "\n",
+            W + "noBreakHyphen": "-"}
+
+# styles.xml stores built-in names in lower case ("heading 1"); Word shows "Heading 1"
+UI_STYLE_NAMES = {"caption": "Caption", "footer": "Footer", "header": "Header",
+                  **{f"heading {i}": f"Heading {i}" for i in range(1, 10)}}
+
+def load_paragraph_styles(zf: zipfile.ZipFile):
+    """
+    Returns ({styleId: UI name} for paragraph styles, name of the default paragraph style).
+    """
+    try:
+        root = ET.fromstring(zf.read("word/styles.xml"))
+    except KeyError:
+        return {}, "Normal"
+    names, default = {}, "Normal"
+    for style in root.iter(W + "style"):
+        if style.get(W + "type", "paragraph") != "paragraph":
+            continue
+        name_el = style.find(W + "name")
+        name = name_el.get(W + "val") if name_el is not None else ""
+        name = UI_STYLE_NAMES.get(name, name)
+        names[style.get(W + "styleId")] = name
+        if style.get(W + "default") in ("1", "true", "on"):
+            default = name
+    return names, default
+
+def run_text(run) -> str:
+    parts = []
+    for child in run:
+        if child.tag in RUN_TEXT:
+            parts.append(child.text or "" if child.tag == W + "t" else RUN_TEXT[child.tag])
+        elif child.tag == W + "br" and child.get(W + "type", "textWrapping") == "textWrapping":
+            parts.append("\n")
+    return "".join(parts)
+
+def paragraph_text(p) -> str:
+    # Direct runs and hyperlink runs only, like python-docx's Paragraph.text
+    parts = []
+    for child in p:
+        if child.tag == RUN:
+            parts.append(run_text(child))
+        elif child.tag == HYPERLINK:
+            parts.extend(run_text(r) for r in child.findall(RUN))
+    return "".join(parts)
+
+def paragraph_style(p, styles: dict, default: str) -> str:
+    pPr = p.find(W + "pPr")
+    style = pPr.find(W + "pStyle") if pPr is not None else None
+    if style is None:
+        return default
+    return styles.get(style.get(W + "val"), default)
+
+def _int_val(parent, tag, default):
+    el = parent.find(tag) if parent is not None else None
+    return int(el.get(W + "val", default)) if el is not None else default
+
+def row_cells(tr, above: dict) -> tuple[list[str], dict]:
+    """
+    Cell texts of one table row in python-docx's Row.cells layout: a cell
+    spanning n grid columns repeats n times and a vertically merged
+    continuation cell repeats the text of the cell above. `above` maps grid
+    offsets of the previous row to their (text, span); the same mapping for
+    this row is returned for the next one.
+    """
+    trPr = tr.find(W + "trPr")
+    offset = _int_val(trPr, W + "gridBefore", 0)
+    cells, current = [], {}
+    for tc in tr.findall(TC):
+        tcPr = tc.find(W + "tcPr")
+        span = _int_val(tcPr, W + "gridSpan", 1)
+        vmerge = tcPr.find(W + "vMerge") if tcPr is not None else None
+        if vmerge is not None and vmerge.get(W + "val", "continue") == "continue" and offset in above:
+            text, span = above[offset]
+        else:
+            text = "\n".join(paragraph_text(p) for p in tc.findall(P))
+        current[offset] = (text, span)
+        cells.extend([text.strip()] * span)
+        offset += span
+    return cells, current
+
+def heading_line(text: str, style_name: str) -> str:
+    level = '#' * int(style_name[-1]) if style_name[-1].isdigit() else '##'
+    return f"\n{level} {text}\n\n"
+
+def stream_docx(docx_path, out, tables_out=None) -> dict:
+    """
+    Streams word/document.xml once and writes body paragraphs and tables in
+    document order. Each body element is dropped from the tree as soon as it
+    has been written (table rows one by one), so memory is bounded by the
+    largest paragraph or table row rather than by the document.
+
+    With `tables_out`, tables go there instead (the former layout, where all
+    tables follow the text after "=== TABLES ===").
+    """
+    stats = {"paragraphs": 0, "tables": 0}
+    with zipfile.ZipFile(docx_path) as zf:
+        styles, default_style = load_paragraph_styles(zf)
+        with zf.open("word/document.xml") as xml:
+            stack = []
+            body = table = None
+            above = {}
+            for event, elem in ET.iterparse(xml, events=("start", "end")):
+                if event == "start":
+                    stack.append(elem)
+                    if elem.tag == BODY:
+                        body = elem
+                    elif elem.tag == TBL and len(stack) >= 2 and stack[-2] is body:
+                        table, above = elem, {}
+                        stats["tables"] += 1
+                        (tables_out or out).write(f"\n[TABLE {stats['tables']}]\n")
+                    continue
+
+                stack.pop()
+                parent = stack[-1] if stack else None
+                if elem.tag == P and parent is body:
+                    stats["paragraphs"] += 1
+                    text = paragraph_text(elem).strip()
+                    if text:
+                        style_name = paragraph_style(elem, styles, default_style)
+                        if style_name.startswith('Heading'):
+                            out.write(heading_line(text, style_name))
+                        else:
+                            out.write(f"{text}\n")
+                    body.remove(elem)
+                elif elem.tag == TR and parent is table and table is not None:
+                    cells, above = row_cells(elem, above)
+                    (tables_out or out).write(" | ".join(cells) + "\n")
+                    table.remove(elem)
+                elif elem.tag == TBL and elem is table:
+                    (tables_out or out).write("\n")
+                    body.remove(elem)
+                    table = None
+                elif parent is body:
+                    body.remove(elem)
+    return stats
+
+def extract_docx(docx_path, output_txt, layout="inline") -> dict:
+    """
+    Extracts one DOCX to text. layout="inline" keeps tables where they occur;
+    "legacy" reproduces the former output with all tables at the end.
+    """
+    output_txt = Path(output_txt)
+    tmp = output_txt.with_name(output_txt.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        if layout == "legacy":
+            # Tables are spooled (to disk once large) until the text is written
+            with tempfile.SpooledTemporaryFile(max_size=8 << 20, mode="w+", encoding="utf-8") as tables:
+                stats = stream_docx(docx_path, f, tables)
+                f.write("\n\n=== TABLES ===\n\n")
+                tables.seek(0)
+                shutil.copyfileobj(tables, f)
+        else:
+            stats = stream_docx(docx_path, f)
+    os.replace(tmp, output_txt)
+    return stats
+
+def extract_directory(input_dir, output_dir, layout="inline", workers=None):
+    """
+    Extracts every *.docx under input_dir in parallel into output_dir/<name>.txt.
+    """
+    docx_files = sorted(p for p in Path(input_dir).rglob("*.docx") if not p.name.startswith("~$"))
+    if not docx_files:
+        print(f"No DOCX files found in {input_dir}")
+        return {}
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(extract_docx, path, output_dir / f"{path.stem}.txt", layout): path
+                   for path in docx_files}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path.name] = future.result()
+                print(f"  {path.name}: {results[path.name]['paragraphs']} paragraphs, "
+                      f"{results[path.name]['tables']} tables")
+            except Exception as e:
+                print(f"[ERROR] {path.name}: {e}")
+    print(f"Extracted {len(results)} of {len(docx_files)} file(s) to {output_dir}")
+    return results
+
+def extract_content(layout="inline"):
     if not os.path.exists(DOCX_PATH):
         print(f"File not found: {DOCX_PATH}")
         return
 
-    doc = Document(DOCX_PATH)
-    
-    with open(OUTPUT_TXT, "w", encoding="utf-8") as f:
-        # Extract all paragraphs
-        for i, para in enumerate(doc.paragraphs):
-            text = para.text.strip()
-            if text:
-                # Check if it's a heading
-                if para.style.name.startswith('Heading'):
-                    f.write(f"\n{'#' * int(para.style.name[-1]) if para.style.name[-1].isdigit() else '##'} {text}\n\n")
-                else:
-                    f.write(f"{text}\n")
-        
-        # Extract tables
-        f.write("\n\n=== TABLES ===\n\n")
-        for table_idx, table in enumerate(doc.tables):
-            f.write(f"\n[TABLE {table_idx + 1}]\n")
-            for row in table.rows:
-                row_data = [cell.text.strip() for cell in row.cells]
-                f.write(" | ".join(row_data) + "\n")
-            f.write("\n")
+    stats = extract_docx(DOCX_PATH, OUTPUT_TXT, layout)
 
     print(f"Extracted content to {OUTPUT_TXT}")
-    print(f"Total paragraphs: {len(doc.paragraphs)}")
-    print(f"Total tables: {len(doc.tables)}")
+    print(f"Total paragraphs: {stats['paragraphs']}")
+    print(f"Total tables: {stats['tables']}")
 
 if __name__ == "__main__":
-    extract_content()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--layout", choices=["inline", "legacy"], default="inline",
+                        help="inline: tables in document order; legacy: all tables after the text")
+    parser.add_argument("--input-dir", type=str,
+                        help="Extract every DOCX in this directory (in parallel) instead")
+    parser.add_argument("--output-dir", type=str, default="extracted",
+                        help="Output directory for --input-dir")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.input_dir:
+        results = extract_directory(args.input_dir, args.output_dir, args.layout, args.workers)
+        sys.exit(0 if results else 1)
+    extract_content(args.layout)
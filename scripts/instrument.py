@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, peak memory is not recorded
+    resource = None
+
+# Turned on by --profile/--trace or PIPELINE_PROFILE=1. When off, stage()
+# only yields a throwaway dict, so instrumented code pays next to nothing.
+ENABLED = os.environ.get("PIPELINE_PROFILE") == "1"
+# Stage records are kept apart from the metrics data, one file per name
+STAGES_DIR = os.path.join("metrics", "stages")
+
+# Nested stages inherit these attributes from the enclosing stage
+INHERITED_KEYS = ("criterion", "source")
+
+_records = []
+_open = []  # stages currently running, in any thread
+_lock = threading.Lock()
+_local = threading.local()
+
+def enable():
+    global ENABLED
+    ENABLED = True
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+if ENABLED:
+    enable()
+
+def _process_peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux; it is the high-water mark of the whole process so far
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def _fold_peak():
+    """
+    Credits the traced-memory peak since the last reset to every open stage
+    and starts a new peak interval. Called with _lock held.
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    for record in _open:
+        record["_peak"] = max(record["_peak"], peak)
+    tracemalloc.reset_peak()
+    return current
+
+@contextmanager
+def stage(name, **attrs):
+    """
+    Records wall time, CPU time and the peak Python/numpy allocations of the
+    enclosed block (above what was allocated when it started). Stages running
+    at the same time in other threads are credited with each other's peaks.
+    Counters such as rows or pages can be added to the yielded dict.
+    """
+    if not ENABLED:
+        yield {}
+        return
+
+    stack = _local.__dict__.setdefault("stack", [])
+    parent = stack[-1] if stack else {}
+    record = {"stage": name, **{k: parent[k] for k in INHERITED_KEYS if k in parent}, **attrs}
+    start_epoch = time.time()
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    with _lock:
+        base = _fold_peak()
+        record["_peak"] = base
+        _open.append(record)
+    stack.append(record)
+    try:
+        yield record
+    finally:
+        stack.pop()
+        end_wall = time.perf_counter()
+        with _lock:
+            _fold_peak()
+            del _open[next(i for i, r in enumerate(_open) if r is record)]
+        record["wall_s"] = round(end_wall - start_wall, 4)
+        record["cpu_s"] = round(time.thread_time() - start_cpu, 4)
+        record["peak_alloc_mb"] = round((record.pop("_peak") - base) / 2**20, 1)
+        record["process_peak_rss_mb"] = _process_peak_rss_mb()
+        # Trace fields (not written to metrics); epoch time lines up worker processes
+        record["_ts"] = start_epoch * 1e6
+        record["_pid"] = os.getpid()
+        record["_tid"] = threading.get_ident()
+        with _lock:
+            _records.append(record)
+
+def records(**match):
+    """
+    Returns the recorded stages whose attributes match, without trace fields.
+    """
+    with _lock:
+        selected = [r for r in _records if all(r.get(k) == v for k, v in match.items())]
+    return [{k: v for k, v in r.items() if not k.startswith("_")} for r in selected]
+
+def drain():
+    """
+    Removes and returns all raw records (used to ship records out of worker processes).
+    """
+    with _lock:
+        taken = list(_records)
+        _records.clear()
+    return taken
+
+def extend(raw_records):
+    with _lock:
+        _records.extend(raw_records)
+
+def stages_path(name) -> str:
+    return os.path.join(STAGES_DIR, f"{name}.json")
+
+def merge_stages(path, script, stage_records):
+    """
+    Stores stage_records under `script` in a stages JSON file (see
+    stages_path), keeping the other scripts' stages already in it.
+    """
+    data = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    data[script] = stage_records
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+def write_chrome_trace(path):
+    """
+    Writes all records as complete ("X") events for chrome://tracing / Perfetto.
+    """
+    with _lock:
+        events = [{
+            "name": r["stage"],
+            "ph": "X",
+            "ts": round(r["_ts"], 1),
+            "dur": round(r["wall_s"] * 1e6, 1),
+            "pid": r["_pid"],
+            "tid": r["_tid"],
+            "args": {k: v for k, v in r.items() if not k.startswith("_") and k != "stage"},
+        } for r in _records]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": events}, f, ensure_ascii=False)
+    print(f"Wrote trace to {path}")
@@ -0,0 +1,121 @@
+import os
+import json
+import asyncio
+import hashlib
+import urllib.error
+import urllib.request
+from pathlib import Path
+from string import Template
+from cache_utils import read_json, write_json
+
+# --- Configuration ---
+# GEMINI_API_BASE can point at a local stub server for testing
+REPO_ROOT = Path(os.getcwd())
+CACHE_DIR = REPO_ROOT / ".cache" / "llm"
+DEFAULT_API_BASE = "https://generativelanguage.googleapis.com"
+DEFAULT_MODEL = "gemini-1.5-flash"
+
+def api_settings() -> dict:
+    return {
+        "base": os.environ.get("GEMINI_API_BASE", DEFAULT_API_BASE).rstrip("/"),
+        "key": os.environ.get("GEMINI_API_KEY", ""),
+        "model": os.environ.get("GEMINI_MODEL", DEFAULT_MODEL),
+    }
+
+def render_prompt(template_text: str, inputs: dict) -> str:
+    """
+    Fills $name / ${name} placeholders; unknown placeholders are left as they are.
+    """
+    return Template(template_text).safe_substitute(inputs)
+
+def cache_key(template_text: str, inputs: dict, model: str) -> str:
+    payload = json.dumps({"template": template_text, "inputs": inputs, "model": model},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def make_job(block_id: str, template_text: str, inputs: dict, model: str | None = None) -> dict:
+    """
+    Describes one LLM call: the target block, the rendered prompt and its cache key.
+    """
+    model = model or api_settings()["model"]
+    return {
+        "block_id": block_id,
+        "model": model,
+        "prompt": render_prompt(template_text, inputs),
+        "key": cache_key(template_text, inputs, model),
+    }
+
+def call_gemini(prompt: str, model: str, settings: dict, timeout: float = 60) -> str:
+    """
+    Calls the Gemini generateContent REST endpoint and returns the text.
+    """
+    url = f"{settings['base']}/v1beta/models/{model}:generateContent"
+    if settings["key"]:
+        url += f"?key={settings['key']}"
+    body = json.dumps({"contents": [{"parts": [{"text": prompt}]}]}).encode("utf-8")
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        data = json.load(response)
+    return data["candidates"][0]["content"]["parts"][0]["text"]
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, (urllib.error.URLError, TimeoutError, ConnectionError))
+
+async def _run_job(job: dict, settings: dict, semaphore: asyncio.Semaphore,
+                   retries: int, backoff: float, stats: dict) -> str | None:
+    cache_path = CACHE_DIR / f"{job['key']}.json"
+    cached = read_json(cache_path)
+    if cached is not None:
+        stats["cached"] += 1
+        return cached["text"]
+
+    async with semaphore:
+        for attempt in range(retries + 1):
+            try:
+                text = await asyncio.to_thread(call_gemini, job["prompt"], job["model"], settings)
+                break
+            except Exception as e:
+                if attempt == retries or not _is_retryable(e):
+                    print(f"[ERROR] LLM block {job['block_id']} failed: {e}")
+                    stats["failed"] += 1
+                    return None
+                await asyncio.sleep(backoff * 2 ** attempt)
+
+    stats["called"] += 1
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    write_json(cache_path, {"model": job["model"], "block_id": job["block_id"], "text": text})
+    return text
+
+async def run_jobs_async(jobs: list[dict], concurrency: int = 4,
+                         retries: int = 3, backoff: float = 1.0) -> list[str | None]:
+    settings = api_settings()
+    stats = {"cached": 0, "called": 0, "failed": 0}
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results = await asyncio.gather(*(
+        _run_job(job, settings, semaphore, retries, backoff, stats) for job in jobs))
+    print(f"LLM blocks: {stats['called']} called, {stats['cached']} cached, {stats['failed']} failed")
+    return results
+
+def run_jobs(jobs: list[dict], concurrency: int = 4,
+             retries: int = 3, backoff: float = 1.0) -> list[str | None]:
+    """
+    Runs all jobs concurrently (at most `concurrency` requests in flight),
+    retrying 429/5xx/network errors with exponential backoff. Results come
+    back in job order; a failed job yields None. Responses are cached by
+    (template, inputs, model), so unchanged reruns make no calls. Without an
+    API key (and with the default endpoint) only cached responses are used.
+    """
+    if not jobs:
+        return []
+    settings = api_settings()
+    if not settings["key"] and settings["base"] == DEFAULT_API_BASE:
+        results = []
+        for job in jobs:
+            cached = read_json(CACHE_DIR / f"{job['key']}.json")
+            results.append(cached["text"] if cached else None)
+        print(f"[WARN] GEMINI_API_KEY not set; {sum(r is not None for r in results)} "
+              f"of {len(jobs)} LLM block(s) served from cache")
+        return results
+    return asyncio.run(run_jobs_async(jobs, concurrency, retries, backoff))
@@ -0,0 +1,151 @@
+import os
+import sqlite3
+import argparse
+from itertools import repeat
+from pathlib import Path
+import pandas as pd
+
+# --- Configuration ---
+REPO_ROOT = Path(os.getcwd())
+DB_PATH = REPO_ROOT / "metrics" / "metrics.db"
+
+# One row per (criterion, source, year, basis, seq, metric). `seq` numbers the
+# records sharing a year and basis, so sources with several rows per year
+# keep all of them. `value` has no declared type so SQLite keeps ints as
+# ints and floats as floats; `text` holds notes.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    criterion TEXT NOT NULL,
+    source    TEXT NOT NULL,
+    year      INTEGER NOT NULL,
+    basis     TEXT NOT NULL DEFAULT '',
+    seq       INTEGER NOT NULL DEFAULT 0,
+    metric    TEXT NOT NULL,
+    value,
+    text      TEXT,
+    PRIMARY KEY (criterion, source, year, basis, seq, metric)
+);
+CREATE INDEX IF NOT EXISTS idx_metrics_lookup ON metrics (criterion, metric, year);
+"""
+
+def connect(path=None) -> sqlite3.Connection:
+    path = Path(path or DB_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(metrics)")]
+    if columns and "seq" not in columns:
+        # Stores from before `seq` dropped duplicate rows; every source is
+        # re-stored on its next parse, so the old table is simply rebuilt.
+        conn.execute("DROP TABLE metrics")
+    conn.executescript(SCHEMA)
+    return conn
+
+def to_long(df: pd.DataFrame, year_col: str, basis_col: str | None = None) -> list[tuple]:
+    """
+    Melts a wide frame (one column per metric) into (year, basis, seq, metric,
+    value, text) tuples. Numeric columns go to `value`, all others to `text`.
+    """
+    years = df[year_col].astype(int).tolist()
+    bases = df[basis_col].astype(str).tolist() if basis_col else [""] * len(df)
+    seqs = pd.DataFrame({"year": years, "basis": bases}).groupby(
+        ["year", "basis"], sort=False).cumcount().tolist()
+    records = []
+    for col in df.columns:
+        if col in (year_col, basis_col):
+            continue
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            # tolist() yields Python ints/floats, which sqlite3 can bind
+            values = [None if v != v else v for v in series.tolist()]
+            records.extend(zip(years, bases, seqs, repeat(col), values, repeat(None)))
+        else:
+            texts = [None if pd.isna(v) else str(v) for v in series.tolist()]
+            records.extend(zip(years, bases, seqs, repeat(col), repeat(None), texts))
+    return records
+
+def replace_source(conn: sqlite3.Connection, criterion: str, source: str,
+                   df: pd.DataFrame, year_col: str, basis_col: str | None = None):
+    """
+    Replaces all records of one data source of a criterion in a single transaction.
+    """
+    rows = [(criterion, source, *r) for r in to_long(df.rename(columns=str), year_col, basis_col)]
+    with conn:
+        conn.execute("DELETE FROM metrics WHERE criterion = ? AND source = ?", (criterion, source))
+        conn.executemany("INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+def delete_source(conn: sqlite3.Connection, criterion: str, source: str):
+    with conn:
+        conn.execute("DELETE FROM metrics WHERE criterion = ? AND source = ?", (criterion, source))
+
+def load_source(conn: sqlite3.Connection, criterion: str, source: str,
+                year_col: str = "year", basis_col: str | None = None,
+                columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Reads one data source back as a wide frame (year, [basis,] one column per
+    metric), with the year/basis columns named as they were stored.
+    """
+    long_df = pd.read_sql_query(
+        "SELECT year, basis, seq, metric, COALESCE(value, text) AS cell FROM metrics "
+        "WHERE criterion = ? AND source = ? ORDER BY rowid",
+        conn, params=(criterion, source))
+    keys = [year_col] + ([basis_col] if basis_col else [])
+    if long_df.empty:
+        return pd.DataFrame(columns=keys + (columns or []))
+    wide = long_df.pivot(index=["year", "basis", "seq"], columns="metric", values="cell")
+    order = columns or list(dict.fromkeys(long_df["metric"]))
+    wide = wide.reindex(columns=order).reset_index()
+    # Restore numeric dtypes lost in the object pivot
+    for col in order:
+        converted = pd.to_numeric(wide[col], errors="coerce")
+        if converted.notna().sum() == wide[col].notna().sum():
+            wide[col] = converted
+    wide = wide.drop(columns="seq")
+    if not basis_col:
+        wide = wide.drop(columns="basis")
+    wide = wide.rename(columns={"year": year_col, "basis": basis_col})
+    wide.columns.name = None
+    return wide
+
+def query(conn: sqlite3.Connection, metric: str, criterion: str | None = None,
+          basis: str | None = None, rolling: int = 1) -> pd.DataFrame:
+    """
+    Values of one metric per (criterion, source, basis, seq, year). With
+    rolling > 1 a trailing `rolling`-year mean is added (e.g. the 3-year
+    average checked against the 64% threshold). The window covers calendar
+    years, so a missing year shortens it; `window_years` says how many
+    years it actually averaged.
+    """
+    window = (f"OVER (PARTITION BY criterion, source, basis, seq ORDER BY year "
+              f"RANGE BETWEEN {max(rolling, 1) - 1} PRECEDING AND CURRENT ROW)")
+    sql = (
+        "SELECT criterion, source, basis, seq, year, value, "
+        f"AVG(value) {window} AS rolling_mean, "
+        f"COUNT(value) {window} AS window_years "
+        "FROM metrics WHERE metric = ?"
+    )
+    params = [metric]
+    if criterion:
+        sql += " AND criterion = ?"
+        params.append(criterion)
+    if basis is not None:
+        sql += " AND basis = ?"
+        params.append(basis)
+    sql += " ORDER BY criterion, source, basis, seq, year"
+    df = pd.read_sql_query(sql, conn, params=params)
+    if (df["seq"] == 0).all():
+        df = df.drop(columns="seq")
+    if rolling <= 1:
+        df = df.drop(columns=["rolling_mean", "window_years"])
+    return df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the typed metrics store")
+    parser.add_argument("metric", help='Metric name, e.g. "final_combined_pct"')
+    parser.add_argument("--criterion", type=str)
+    parser.add_argument("--basis", type=str)
+    parser.add_argument("--rolling", type=int, default=1,
+                        help="Add a trailing N-year mean")
+    args = parser.parse_args()
+
+    with connect() as conn:
+        print(query(conn, args.metric, args.criterion, args.basis, args.rolling).to_string(index=False))
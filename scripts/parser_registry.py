@@ -0,0 +1,59 @@
+import importlib
+import importlib.util
+from functools import lru_cache
+
+# A data source's `parser` in config.yml is either one of these names or a
+# "module:function" reference (e.g. "parsers:parse_fulltime_ratio"). Modules
+# are imported only when a configured source is actually parsed, so heavy
+# dependencies (pandas, openpyxl, pdfplumber, ...) are not loaded at startup.
+BUILTIN_PARSERS = {
+    "parse_fulltime_ratio": "parsers:parse_fulltime_ratio",
+    "parse_new_hires": "parsers:parse_new_hires",
+}
+
+def parser_ref(source: dict) -> str:
+    name = source['parser']
+    return BUILTIN_PARSERS.get(name, name)
+
+def renderer_ref(source: dict) -> str:
+    """
+    The source's `renderer` reference, or by default the function next to the
+    parser named render_<x> for parse_<x>.
+    """
+    if source.get('renderer'):
+        return source['renderer']
+    module, _, func = parser_ref(source).partition(":")
+    return f"{module}:{func.replace('parse_', 'render_', 1)}"
+
+def _split(ref: str):
+    module, sep, func = ref.partition(":")
+    if not sep or not module or not func:
+        raise ValueError(f'Parser reference must look like "module:function", got "{ref}"')
+    return module, func
+
+def module_file(ref: str) -> str | None:
+    """
+    Path of the module a reference points to, found without importing it.
+    """
+    try:
+        spec = importlib.util.find_spec(_split(ref)[0])
+    except (ImportError, ValueError):
+        return None
+    return spec.origin if spec else None
+
+def is_available(source: dict) -> bool:
+    return module_file(parser_ref(source)) is not None
+
+@lru_cache(maxsize=None)
+def load(ref: str):
+    """
+    Imports the module of a "module:function" reference and returns the function.
+    """
+    module, func = _split(ref)
+    return getattr(importlib.import_module(module), func)
+
+def get_parser(source: dict):
+    return load(parser_ref(source))
+
+def get_renderer(source: dict):
+    return load(renderer_ref(source))
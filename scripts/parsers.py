@@ -1,48 +1,143 @@
 import pandas as pd
 import os
+from excel_cache import read_excel_cached, read_excel_chunks
+from instrument import stage
+from table_renderer import COLOR_4TH, color_cells, format_cells, render_markdown
+
+FULLTIME_RATIO_COLUMNS = ['Year', 'Count', 'Quota', 'Ratio', 'Note']
 
 def parse_fulltime_ratio(file_paths):
     """
     Parses Excel files for Full-time Faculty Ratio.
     Expected columns: Year, Count, Quota, Ratio, Note
-    Returns a Markdown table string.
+    Returns the typed records (one row per year; see render_fulltime_ratio),
+    or None when a file cannot be read.
     """
     all_data = []
     for file_path in file_paths:
         try:
-            df = pd.read_excel(file_path)
+            with stage("load_excel", file=os.path.basename(file_path)) as rec:
+                df = read_excel_cached(file_path, columns=FULLTIME_RATIO_COLUMNS)
+                rec["rows"] = len(df)
             all_data.append(df)
         except Exception as e:
             print(f"Error reading {file_path}: {e}")
-            return ""
+            return None
 
     if not all_data:
-        return ""
-        
+        return pd.DataFrame(columns=FULLTIME_RATIO_COLUMNS)
+
     combined_df = pd.concat(all_data)
     # Sort by Year if possible
     if 'Year' in combined_df.columns:
         combined_df = combined_df.sort_values('Year')
+    return combined_df.reset_index(drop=True)
+
+def render_fulltime_ratio(df):
+    """
+    Renders Full-time Faculty Ratio records as Markdown table rows.
+    """
+    if df.empty:
+        return ""
+    # Generate Markdown Table Rows (4th cycle color: Orange)
+    cells = format_cells(df.sort_values('Year'), FULLTIME_RATIO_COLUMNS)
+    cells = color_cells(cells, COLOR_4TH, style="color: {color};")
+    return render_markdown(cells)
+
+# HR roster export: one row per appointment (신규/재임용/승진 ...) of every faculty member
+ROSTER_COLUMNS = {"임용일자": "Date", "임용구분": "Kind", "소속": "Affiliation",
+                  "직제": "Rank", "교원유형": "Type"}
+NEW_HIRE_KIND = "신규"
+ROSTER_CHUNK_ROWS = 50_000
+NEW_HIRES_KEYS = ['Year', 'Affiliation', 'Rank', 'Type']
+NEW_HIRES_COLUMNS = ['Year', 'Group', 'Affiliation', 'Rank', 'Type', 'Count']
+# Composition tables rendered from the new-hire counts: (column, title)
+NEW_HIRES_TABLES = [('Affiliation', '소속별'), ('Rank', '직제별'), ('Type', '유형별')]
+NEW_HIRES_YEARS = 3
 
-    # Generate Markdown Table Rows
-    lines = []
-    for _, row in combined_df.iterrows():
-        year = row.get('Year', '')
-        count = row.get('Count', '')
-        quota = row.get('Quota', '')
-        ratio = row.get('Ratio', '')
-        note = row.get('Note', '')
-        
-        # Apply 4th cycle color (Orange)
-        line = f"| <span style=\"color: #ff7f0e;\">{year}</span> | <span style=\"color: #ff7f0e;\">{count}</span> | <span style=\"color: #ff7f0e;\">{quota}</span> | <span style=\"color: #ff7f0e;\">{ratio}</span> | <span style=\"color: #ff7f0e;\">{note}</span> |"
-        lines.append(line)
-        
-    return "\n".join(lines)
+def appointment_years(dates):
+    """
+    Appointment year of every roster row. Dates may be Excel serial numbers
+    (streamed .xlsx), datetimes or strings such as "2024-03-01".
+    """
+    serial = pd.to_numeric(dates, errors='coerce')
+    years = pd.to_datetime(serial, unit='D', origin='1899-12-30', errors='coerce').dt.year
+    text = years.isna() & dates.notna()
+    if text.any():
+        years[text] = pd.to_datetime(dates[text].astype(str), errors='coerce', format='mixed').dt.year
+    return years
+
+def count_new_hires(chunk):
+    """
+    New hires per (Year, Affiliation, Rank, Type) in one roster chunk.
+    """
+    chunk = chunk.rename(columns=ROSTER_COLUMNS)
+    hires = chunk[chunk['Kind'].astype(str).str.strip() == NEW_HIRE_KIND]
+    keys = pd.DataFrame({'Year': appointment_years(hires['Date'])})
+    for col in NEW_HIRES_KEYS[1:]:
+        keys[col] = hires[col].fillna('미상').astype(str).str.strip()
+    keys = keys.dropna(subset=['Year'])
+    return keys.groupby(NEW_HIRES_KEYS).size()
 
 def parse_new_hires(file_paths):
     """
-    Parses Excel files for New Hires.
-    Returns a Markdown table string.
+    Parses HR roster exports (.xlsx or .csv) into new-hire counts per year,
+    affiliation, rank and faculty type. Rosters are streamed in chunks of
+    ROSTER_CHUNK_ROWS and the per-chunk counts are added up as they arrive,
+    so memory depends on the number of groups, not on the roster size.
+    A roster that cannot be read is skipped; the others still count.
+    Returns the typed records (one row per group and year; see
+    render_new_hires), or None when no roster could be read at all.
     """
-    # Placeholder implementation
-    return "| <span style=\"color: #ff7f0e;\">2024</span> | <span style=\"color: #ff7f0e;\">10</span> | <span style=\"color: #ff7f0e;\">New Hires Data</span> |"
+    counts, read = None, 0
+    for file_path in file_paths:
+        try:
+            with stage("stream_roster", file=os.path.basename(file_path)) as rec:
+                rows, file_counts = 0, None
+                for chunk in read_excel_chunks(file_path, list(ROSTER_COLUMNS), ROSTER_CHUNK_ROWS):
+                    rows += len(chunk)
+                    chunk_counts = count_new_hires(chunk)
+                    file_counts = (chunk_counts if file_counts is None
+                                   else file_counts.add(chunk_counts, fill_value=0))
+                rec["rows"] = rows
+        except Exception as e:
+            # Counts of a partly read roster are dropped with it
+            print(f"Error reading {file_path}: {e}")
+            continue
+        read += 1
+        if file_counts is not None:
+            counts = file_counts if counts is None else counts.add(file_counts, fill_value=0)
+
+    if not read:
+        return None
+    if counts is None or counts.empty:
+        return pd.DataFrame(columns=NEW_HIRES_COLUMNS)
+
+    df = counts.astype(int).rename('Count').reset_index()
+    df['Year'] = df['Year'].astype(int)
+    # Store key: one basis per group within a year
+    df['Group'] = df['Affiliation'] + '/' + df['Rank'] + '/' + df['Type']
+    return df[NEW_HIRES_COLUMNS].sort_values(NEW_HIRES_KEYS).reset_index(drop=True)
+
+def render_new_hires(df):
+    """
+    Renders new-hire records of the latest NEW_HIRES_YEARS years as
+    소속별·직제별·유형별 tables (one column per year plus the total).
+    """
+    if df.empty:
+        return ""
+    years = sorted(df['Year'].unique())[-NEW_HIRES_YEARS:]
+    df = df[df['Year'].isin(years)]
+    tables = []
+    for col, title in NEW_HIRES_TABLES:
+        table = df.pivot_table(index=col, columns='Year', values='Count', aggfunc='sum', fill_value=0)
+        table = table.reindex(columns=years, fill_value=0)
+        table['계'] = table.sum(axis=1)
+        table.loc['계'] = table.sum()
+        table = table.reset_index()
+        value_cols = list(table.columns[1:])
+        cells = format_cells(table, [col] + value_cols, {c: "%d" for c in value_cols})
+        cells = color_cells(cells, COLOR_4TH, style="color: {color};")
+        header = ["구분"] + [f"{y}년" for y in years] + ["계"]
+        tables.append(f"**{title}**\n\n" + render_markdown(cells, header))
+    return "\n\n".join(tables)
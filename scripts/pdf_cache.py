@@ -0,0 +1,131 @@
+import os
+from pathlib import Path
+import pdfplumber
+import pypdfium2
+from cache_utils import file_hash, read_json, write_json
+
+# --- Configuration ---
+REPO_ROOT = Path(os.getcwd())
+CACHE_DIR = REPO_ROOT / ".cache" / "pdf_pages"
+
+def extract_raw_texts(pdf_path: Path) -> list[str]:
+    """
+    Reads the raw text layer of every page with pdfium (no layout analysis).
+    Much cheaper than pdfplumber's extract_text(); good enough for keyword tests.
+    """
+    texts = []
+    pdf = pypdfium2.PdfDocument(str(pdf_path))
+    try:
+        for page in pdf:
+            textpage = page.get_textpage()
+            texts.append(textpage.get_text_range())
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+    return texts
+
+class CachedPage:
+    """
+    Stand-in for a pdfplumber page. extract_text()/extract_tables() are served
+    from the cache and only fall back to pdfplumber on a miss.
+    """
+    def __init__(self, doc: "CachedPdf", page_no: int):
+        self.doc = doc
+        self.page_no = page_no
+
+    def _entry_path(self) -> Path:
+        return self.doc.cache_dir / f"{self.page_no}.json"
+
+    def _get(self, key: str, compute):
+        path = self._entry_path()
+        entry = read_json(path) or {}
+        if key not in entry:
+            entry[key] = compute(self.doc.pdf_page(self.page_no))
+            write_json(path, entry)
+        else:
+            self.doc.hits += 1
+        return entry[key]
+
+    def extract_text(self) -> str:
+        return self._get("text", lambda page: page.extract_text())
+
+    def extract_tables(self) -> list:
+        return self._get("tables", lambda page: page.extract_tables())
+
+    def release(self):
+        """
+        Frees pdfplumber's per-page caches (layout objects, text map) and the
+        document's parsed-object cache, so memory does not grow with page count.
+        """
+        pdf = self.doc._pdf
+        if pdf is None:
+            return
+        pdf.pages[self.page_no].close()
+        for cache in ("_cached_objs", "_parsed_objs"):
+            getattr(pdf.doc, cache, {}).clear()
+
+    def crop(self, bbox) -> "CachedCrop":
+        return CachedCrop(self, tuple(bbox))
+
+class CachedCrop:
+    """
+    Stand-in for page.crop(bbox); its tables are cached per bbox.
+    """
+    def __init__(self, page: CachedPage, bbox: tuple):
+        self.page = page
+        self.bbox = bbox
+
+    def extract_tables(self) -> list:
+        key = "tables@" + ",".join(f"{v:.2f}" for v in self.bbox)
+        return self.page._get(key, lambda page: page.crop(self.bbox).extract_tables())
+
+class CachedPdf:
+    """
+    Context manager mirroring pdfplumber.open(), backed by an on-disk cache
+    keyed by file hash and page number. The PDF itself is only opened when a
+    page is not in the cache yet.
+    """
+    def __init__(self, pdf_path: Path, cache_dir: Path | None = None):
+        self.pdf_path = Path(pdf_path)
+        self.hash = file_hash(self.pdf_path)
+        self.cache_dir = Path(cache_dir or CACHE_DIR) / self.hash
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._pdf = None
+        self.hits = 0
+
+        meta = read_json(self.cache_dir / "meta.json")
+        if meta is None:
+            meta = {"file": self.pdf_path.name, "page_count": len(self._open().pages)}
+            write_json(self.cache_dir / "meta.json", meta)
+        self.pages = [CachedPage(self, i) for i in range(meta["page_count"])]
+
+    def raw_texts(self) -> list[str]:
+        """
+        Raw (unlaid-out) text of every page, cached alongside the page entries.
+        """
+        path = self.cache_dir / "raw_text.json"
+        texts = read_json(path)
+        if texts is None:
+            texts = extract_raw_texts(self.pdf_path)
+            write_json(path, texts)
+        return texts
+
+    def _open(self):
+        if self._pdf is None:
+            self._pdf = pdfplumber.open(self.pdf_path)
+        return self._pdf
+
+    def pdf_page(self, page_no: int):
+        return self._open().pages[page_no]
+
+    def close(self):
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,24 +1,119 @@
+import os
 import re
+import stat
+import tempfile
+from contextlib import contextmanager
 
-def update_markdown_block(file_path, block_id, new_content):
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locking, writes are still atomic
+    fcntl = None
+
+# Both marker styles used in the reports:
+#   <!-- START: AUTO-GEN id=ID --> ... <!-- END: AUTO-GEN -->
+#   <!-- AUTO-GEN:ID-START --> ... <!-- AUTO-GEN:ID-END -->
+BLOCK_PATTERNS = [
+    re.compile(r"<!-- START: AUTO-GEN id=(?P<id>\S+) -->(?P<body>.*?)<!-- END: AUTO-GEN -->", re.DOTALL),
+    re.compile(r"<!-- AUTO-GEN:(?P<id>\S+?)-START -->(?P<body>.*?)<!-- AUTO-GEN:(?P=id)-END -->", re.DOTALL),
+]
+
+def index_blocks(text):
     """
-    Updates the content between <!-- START: AUTO-GEN id=block_id --> and <!-- END: AUTO-GEN -->
+    Returns {block_id: [(body_start, body_end), ...]} for every AUTO-GEN block.
+    """
+    index = {}
+    for pattern in BLOCK_PATTERNS:
+        for m in pattern.finditer(text):
+            index.setdefault(m.group("id"), []).append(m.span("body"))
+    return index
+
+def apply_block_updates(text, updates, index=None):
+    """
+    Replaces the body of every block in updates ({block_id: content}) in one pass.
+    `index` is index_blocks(text) if the caller already has it.
+    Returns (new_text, ids_found).
     """
+    if index is None:
+        index = index_blocks(text)
+    spans = []
+    for block_id, content in updates.items():
+        for start, end in index.get(block_id, []):
+            spans.append((start, end, f"\n{content}\n"))
+    spans.sort()
+
+    parts = []
+    pos = 0
+    for start, end, body in spans:
+        parts.append(text[pos:start])
+        parts.append(body)
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts), [b for b in updates if b in index]
+
+@contextmanager
+def locked(file_path):
+    """
+    Holds an exclusive lock on a sidecar .lock file while the report is rewritten,
+    so several criteria can be processed at the same time.
+    """
+    directory, name = os.path.split(os.path.abspath(file_path))
+    lock_path = os.path.join(directory, f".{name}.lock")
+    with open(lock_path, "w") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def write_atomic(file_path, content):
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".md")
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            
-        pattern = f"(<!-- START: AUTO-GEN id={block_id} -->)(.*?)(<!-- END: AUTO-GEN -->)"
-        replacement = f"\\1\n{new_content}\n\\3"
-        
-        new_full_content = re.sub(pattern, replacement, content, flags=re.DOTALL)
-        
-        if content != new_full_content:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(new_full_content)
-            print(f"Updated block {block_id} in {file_path}")
-        else:
-            print(f"No changes for block {block_id} in {file_path}")
-            
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        # mkstemp creates 0600 files; keep the original permissions (new files: 0644)
+        try:
+            mode = stat.S_IMODE(os.stat(file_path).st_mode)
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def update_markdown_blocks(file_path, updates):
+    """
+    Updates several AUTO-GEN blocks of one report with a single read and a
+    single atomic write. The file is not touched when nothing changed.
+    Returns True if the file was written.
+    """
+    try:
+        with locked(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+
+            new_full_content, found = apply_block_updates(content, updates)
+            for block_id in updates:
+                if block_id not in found:
+                    print(f"[WARN] Block {block_id} not found in {file_path}")
+
+            if content == new_full_content:
+                print(f"No changes for {len(found)} block(s) in {file_path}")
+                return False
+
+            write_atomic(file_path, new_full_content)
+            print(f"Updated {len(found)} block(s) in {file_path}: {', '.join(found)}")
+            return True
+
     except Exception as e:
         print(f"Error updating markdown: {e}")
+        return False
+
+def update_markdown_block(file_path, block_id, new_content):
+    """
+    Updates the content between <!-- START: AUTO-GEN id=block_id --> and <!-- END: AUTO-GEN -->
+    """
+    return update_markdown_blocks(file_path, {block_id: new_content})
@@ -0,0 +1,315 @@
+"""
+Local report-build service. Keeps every criterion's config, the parsed data
+sources, the 3.1 ratio tables and the reports' AUTO-GEN block indexes in
+memory, so refreshing a block costs milliseconds instead of a new
+interpreter, the pandas import and a full parse.
+
+Usage:
+    python scripts/report_server.py                    # http://127.0.0.1:8765
+    curl -X POST http://127.0.0.1:8765/blocks/3.1-RATIO-4TH
+    curl -X POST http://127.0.0.1:8765/criteria/3.1    # all data blocks + metrics/3.1.json
+    curl http://127.0.0.1:8765/metrics/3.1
+    curl http://127.0.0.1:8765/status
+
+Cached state is checked against file stats on every request: a changed data
+file is re-parsed, a changed config.yml reloads its criterion, and a report
+edited in the meantime is re-read before it is written. Requests touching
+the same report are serialized; other reports are served in parallel.
+GET /metrics only parses what changed and never writes a report. LLM
+blocks are not generated here (run update_criteria.py / update_3_1.py).
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+import metrics_store
+import parser_registry
+import update_3_1
+import update_criteria
+from renderer import apply_block_updates, index_blocks, locked, write_atomic
+
+# --- Configuration ---
+HOST = "127.0.0.1"
+PORT = 8765
+# Blocks update_3_1.py fills from faculty_numbers_*.csv
+RATIO_CRITERION = "3.1"
+RATIO_BLOCKS = ("3.1-DETAIL-RATIO-TABLE", "3.1-RATIO-3RD", "3.1-RATIO-4TH")
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+class Report:
+    """
+    A report's text and block index, re-read only when the file changes.
+    `lock` serializes every request that renders into this report.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.signature = None
+        self.text = ""
+        self.index = {}
+
+    def refresh(self):
+        signature = file_signature(self.path)
+        if signature != self.signature:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.text = f.read()
+            self.index = index_blocks(self.text)
+            self.signature = signature
+
+    def write(self, updates: dict):
+        """
+        Applies {block_id: content}; returns (blocks found, written).
+        """
+        with locked(self.path):
+            self.refresh()
+            new_text, found = apply_block_updates(self.text, updates, self.index)
+            if new_text == self.text:
+                return found, False
+            write_atomic(self.path, new_text)
+            self.text, self.index = new_text, index_blocks(new_text)
+            self.signature = file_signature(self.path)
+            return found, True
+
+class Workspace:
+    """
+    In-memory build state of all criteria. Producers map a block id to the
+    function that renders it (None when its inputs are missing).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()  # guards the dicts below, not the work
+        self.reports = {}    # abs path -> Report
+        self.criteria = {}   # criterion id -> {"config", "signature", "report", "sources", "metrics"}
+        self.metrics_locks = {}  # criterion id -> lock guarding its "metrics" and metrics/<cid>.json
+        self.producers = {}  # block id -> [(criterion id, report path, render())]
+        self.ratio = None    # (csv signature, {block id: content})
+
+    # --- State ---
+    def report(self, path) -> Report:
+        with self.lock:
+            return self.reports.setdefault(path, Report(path))
+
+    def metrics_lock(self, cid) -> threading.Lock:
+        with self.lock:
+            return self.metrics_locks.setdefault(cid, threading.Lock())
+
+    def sync(self):
+        """
+        Loads new criteria and reloads those whose config.yml changed.
+        """
+        with self.lock:
+            for cid in update_criteria.discover_criteria():
+                entry = self.criteria.get(cid)
+                config_path = os.path.join("criteria", cid, "config.yml")
+                if entry is None or entry["signature"] != file_signature(config_path):
+                    self._load_criterion(cid, config_path)
+
+    def _load_criterion(self, cid, config_path):
+        config = update_criteria.load_config(cid)
+        report = update_criteria.resolve_report_path(cid, config)
+        entry = {"config": config, "signature": file_signature(config_path), "report": report,
+                 "sources": {}, "metrics": {}}
+        for block_id in list(self.producers):
+            self.producers[block_id] = [p for p in self.producers[block_id] if p[0] != cid]
+        for source in config.get('data_sources', []):
+            if not report or not parser_registry.is_available(source):
+                continue
+            entry["sources"][source['id']] = {"source": source, "signature": None,
+                                              "records": [], "markdown": None}
+            self.producers.setdefault(source['target_block'], []).append(
+                (cid, report, lambda cid=cid, sid=source['id']: self.source_block(cid, sid)))
+        if cid == RATIO_CRITERION and os.path.exists(update_3_1.MD_PATH):
+            for block_id in RATIO_BLOCKS:
+                self.producers.setdefault(block_id, []).append(
+                    (cid, os.path.abspath(update_3_1.MD_PATH),
+                     lambda block_id=block_id: self.ratio_tables().get(block_id)))
+        self.criteria[cid] = entry
+
+    # --- Producers (called with the report's lock held) ---
+    def source_block(self, cid, sid):
+        """
+        Markdown of one data source; re-parsed only if one of its files changed.
+        """
+        entry = self.criteria[cid]
+        state = entry["sources"][sid]
+        files = update_criteria.source_files(cid, state["source"])
+        signature = tuple(file_signature(f) for f in files)
+        if signature != state["signature"]:
+            conn = metrics_store.connect()
+            try:
+                if update_criteria.parse_source(conn, cid, state["source"]):
+                    records, markdown = update_criteria.render_source(conn, cid, state["source"]) or ([], "")
+                else:
+                    records, markdown = [], None
+            finally:
+                conn.close()
+            state.update(signature=signature, records=records, markdown=markdown)
+            # Like update_criteria: sources without files are left out of the metrics
+            with self.metrics_lock(cid):
+                if markdown is None:
+                    entry["metrics"].pop(sid, None)
+                else:
+                    entry["metrics"][sid] = records
+        return state["markdown"]
+
+    def ratio_tables(self) -> dict:
+        """
+        The update_3_1 tables; recomputed only if the faculty numbers CSV changed.
+        """
+        signature = file_signature(update_3_1.DATA_PATH)
+        if self.ratio is None or self.ratio[0] != signature:
+            tables = update_3_1.update_tables()
+            self.ratio = (signature, dict(zip(RATIO_BLOCKS, (t.strip() for t in tables)))
+                                     if tables[0] else {})
+        return self.ratio[1]
+
+    # --- Requests ---
+    def render(self, producers) -> dict:
+        """
+        Renders the given producers and writes each report once, holding its lock.
+        """
+        by_report = {}
+        for block_id, cid, path, produce in producers:
+            by_report.setdefault(path, []).append((block_id, produce))
+        result = {}
+        for path, blocks in by_report.items():
+            report = self.report(path)
+            with report.lock:
+                updates = {}
+                for block_id, produce in blocks:
+                    content = produce()
+                    if content is not None:
+                        updates[block_id] = content
+                found, written = report.write(updates) if updates else ([], False)
+            result[os.path.relpath(path)] = {"blocks": found, "written": written,
+                                             "skipped": [b for b, _ in blocks if b not in updates]}
+        return result
+
+    def refresh_block(self, block_id) -> dict:
+        self.sync()
+        if block_id not in self.producers or not self.producers[block_id]:
+            raise KeyError(f"No data block {block_id}")
+        return self.render([(block_id, *p) for p in self.producers[block_id]])
+
+    def recompute(self, cid) -> dict:
+        """
+        Re-renders every data block of a criterion and saves metrics/<cid>.json.
+        """
+        self.sync()
+        if cid not in self.criteria:
+            raise KeyError(f"No criteria/{cid}/config.yml")
+        result = self.render([(block_id, *p) for block_id, producers in self.producers.items()
+                              for p in producers if p[0] == cid])
+        entry = self.criteria[cid]
+        os.makedirs("metrics", exist_ok=True)
+        with self.metrics_lock(cid):
+            metrics = dict(entry["metrics"])
+            write_atomic(f"metrics/{cid}.json", json.dumps(metrics, indent=2, ensure_ascii=False))
+        return {"reports": result, "metrics": metrics}
+
+    def metrics(self, cid) -> dict:
+        """
+        The criterion's records, re-parsing only sources whose files changed.
+        Reports and metrics/<cid>.json are not written.
+        """
+        self.sync()
+        if cid not in self.criteria:
+            raise KeyError(f"No criteria/{cid}/config.yml")
+        entry = self.criteria[cid]
+        if entry["sources"]:
+            # source_block expects the report's lock, like the render path
+            with self.report(entry["report"]).lock:
+                for sid in entry["sources"]:
+                    self.source_block(cid, sid)
+        with self.metrics_lock(cid):
+            return dict(entry["metrics"])
+
+    def status(self) -> dict:
+        self.sync()
+        return {
+            "criteria": {cid: {"report": e["report"] and os.path.relpath(e["report"]),
+                               "sources": {sid: s["signature"] is not None for sid, s in e["sources"].items()}}
+                         for cid, e in self.criteria.items()},
+            "blocks": sorted(self.producers),
+            "reports": {os.path.relpath(p): sorted(r.index) for p, r in self.reports.items()},
+        }
+
+    def warm_up(self):
+        self.sync()
+        for cid in list(self.criteria):
+            self.recompute(cid)
+
+class Handler(BaseHTTPRequestHandler):
+    workspace: Workspace = None
+
+    def _send(self, code, payload):
+        body = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, routes):
+        parts = [unquote(p) for p in urlparse(self.path).path.strip("/").split("/")]
+        start = time.perf_counter()
+        try:
+            handler = routes.get(parts[0]) if len(parts) == 2 or parts == ["status"] else None
+            if handler is None:
+                self._send(404, {"error": f"Unknown endpoint {self.command} {self.path}"})
+                return
+            payload = handler(*parts[1:])
+            payload = {"result": payload, "ms": round((time.perf_counter() - start) * 1000, 1)}
+            self._send(200, payload)
+        except KeyError as e:
+            self._send(404, {"error": e.args[0]})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def do_GET(self):
+        ws = self.workspace
+        self._dispatch({"status": ws.status, "metrics": ws.metrics})
+
+    def do_POST(self):
+        ws = self.workspace
+        self._dispatch({"blocks": ws.refresh_block, "criteria": ws.recompute})
+
+    def log_message(self, format, *args):
+        print(f"[{time.strftime('%H:%M:%S')}] {format % args}")
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Editors may fire a burst of requests on save; the default backlog is 5
+    request_queue_size = 64
+
+def serve(host=HOST, port=PORT):
+    workspace = Workspace()
+    start = time.perf_counter()
+    workspace.warm_up()
+    print(f"Loaded {len(workspace.criteria)} criteria, {len(workspace.producers)} data block(s) "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+    Handler.workspace = workspace
+    server = Server((host, port), Handler)
+    print(f"Serving on http://{host}:{port} (Ctrl+C to stop)...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped.")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local report-build service")
+    parser.add_argument("--host", type=str, default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+
+    serve(args.host, args.port)
@@ -0,0 +1,362 @@
+"""
+Full-text search over the extracted 3rd-cycle content and the reports.
+
+Korean is indexed as character bigrams of the text with whitespace and
+punctuation removed, so a query matches regardless of spacing
+("교원확보" finds "교원 확보"). Passages (a few lines of one page / table /
+section) are ranked with BM25 and returned with their location and a
+snippet. The index lives in .cache/search/index.db and is updated
+incrementally: only files whose contents changed are re-indexed.
+
+Usage:
+    python scripts/search_index.py build                 # default sources
+    python scripts/search_index.py build "data/**/*.txt" # add more files
+    python scripts/search_index.py query "전임교원 확보율" -k 5
+"""
+import os
+import re
+import glob
+import math
+import sqlite3
+import argparse
+import time
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from cache_utils import file_hash
+
+# --- Configuration ---
+REPO_ROOT = Path(os.getcwd())
+DB_PATH = REPO_ROOT / ".cache" / "search" / "index.db"
+DEFAULT_SOURCES = ["temp_3rd_cycle_content.txt", "3rd_cycle_extracted.txt", "report/*.md"]
+PASSAGE_LINES = 4
+N = 2
+# BM25 parameters
+K1, B = 1.2, 0.75
+# Bump when tokenization or passage splitting changes; the index is rebuilt
+INDEX_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id    INTEGER PRIMARY KEY,
+    path  TEXT UNIQUE NOT NULL,
+    mtime INTEGER NOT NULL,
+    size  INTEGER NOT NULL,
+    sha   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS passages (
+    id      INTEGER PRIMARY KEY,
+    doc_id  INTEGER NOT NULL,
+    line    INTEGER NOT NULL,
+    page    INTEGER,
+    tbl     TEXT,
+    section TEXT,
+    length  INTEGER NOT NULL,
+    text    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_passages_doc ON passages (doc_id);
+CREATE TABLE IF NOT EXISTS postings (
+    gram       TEXT NOT NULL,
+    passage_id INTEGER NOT NULL,
+    tf         INTEGER NOT NULL,
+    PRIMARY KEY (gram, passage_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_postings_passage ON postings (passage_id);
+"""
+
+PAGE_RE = re.compile(r"^--- Page (\d+) ---$")
+TABLE_RE = re.compile(r"^\[TABLE (\d+|START|END)\]$")
+HEADING_RE = re.compile(r"^#{1,6}\s+(.*)$")
+# Everything that is not a letter or digit is dropped before n-gramming
+STRIP_RE = re.compile(r"[\W_]+")
+
+def connect(path=None) -> sqlite3.Connection:
+    path = Path(path or DB_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+        conn.executescript("DROP TABLE IF EXISTS postings; DROP TABLE IF EXISTS passages; "
+                           "DROP TABLE IF EXISTS docs;")
+        conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+    conn.executescript(SCHEMA)
+    return conn
+
+def normalize(text: str) -> str:
+    return STRIP_RE.sub("", unicodedata.normalize("NFKC", text).lower())
+
+def ngrams(text: str, n: int = N) -> list[str]:
+    """
+    Character n-grams of the normalized text; text shorter than n is one gram.
+    """
+    norm = normalize(text)
+    if len(norm) <= n:
+        return [norm] if norm else []
+    return [norm[i:i + n] for i in range(len(norm) - n + 1)]
+
+def split_passages(lines):
+    """
+    Groups lines into passages of up to PASSAGE_LINES lines that share the
+    same page ("--- Page N ---"), table and section (last "#" heading).
+    Tables are "[TABLE n]" blocks (DOCX extract), "[TABLE START]".."[TABLE END]"
+    (PDF extract, numbered per page as "<page>-<k>") or Markdown pipe tables
+    (numbered per file as "md<k>"). Yields (line, page, table, section, text).
+    """
+    page = table = section = None
+    md_tables = page_tables = 0
+    buf, start = [], 0
+
+    def flush():
+        if buf:
+            yield start, page, table, section, "\n".join(buf)
+            buf.clear()
+
+    for no, raw in enumerate(lines, 1):
+        line = raw.strip()
+        match = PAGE_RE.match(line)
+        if match:
+            yield from flush()
+            page, table, page_tables = int(match.group(1)), None, 0
+            continue
+        match = TABLE_RE.match(line)
+        if match:
+            yield from flush()
+            if match.group(1) == "START":
+                page_tables += 1
+                table = f"{page}-{page_tables}"
+            elif match.group(1) == "END":
+                table = None
+            else:
+                table = match.group(1)
+            continue
+        match = HEADING_RE.match(line)
+        if match:
+            yield from flush()
+            section, table = match.group(1).strip(), None
+            continue
+        if not line or line.startswith("<!--"):
+            yield from flush()
+            if not line and table is not None and table.isdigit():
+                table = None
+            continue
+        # Markdown pipe tables are numbered per file
+        is_pipe = line.startswith("|")
+        if is_pipe and table is None:
+            yield from flush()
+            md_tables += 1
+            table = f"md{md_tables}"
+        elif not is_pipe and table is not None and table.startswith("md"):
+            yield from flush()
+            table = None
+        if set(line) <= set("|-: "):
+            continue
+        if not buf:
+            start = no
+        buf.append(line)
+        if len(buf) >= PASSAGE_LINES:
+            yield from flush()
+    yield from flush()
+
+def rel(path) -> str:
+    return Path(os.path.relpath(os.path.abspath(path), REPO_ROOT)).as_posix()
+
+def resolve_sources(patterns) -> list[str]:
+    paths = []
+    for pattern in patterns:
+        paths.extend(sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern])
+    return [rel(p) for p in dict.fromkeys(paths) if os.path.isfile(p)]
+
+def index_file(conn: sqlite3.Connection, path: str, st, sha: str):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        passages = list(split_passages(f))
+    conn.execute("INSERT INTO docs (path, mtime, size, sha) VALUES (?, ?, ?, ?)",
+                 (path, st.st_mtime_ns, st.st_size, sha))
+    doc_id = conn.execute("SELECT id FROM docs WHERE path = ?", (path,)).fetchone()[0]
+    postings = []
+    for line, page, table, section, text in passages:
+        grams = Counter(ngrams(text))
+        cur = conn.execute(
+            "INSERT INTO passages (doc_id, line, page, tbl, section, length, text) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (doc_id, line, page, table, section, sum(grams.values()), text))
+        postings.extend((g, cur.lastrowid, tf) for g, tf in grams.items())
+    conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+    return len(passages)
+
+def remove_doc(conn: sqlite3.Connection, doc_id: int):
+    conn.execute("DELETE FROM postings WHERE passage_id IN "
+                 "(SELECT id FROM passages WHERE doc_id = ?)", (doc_id,))
+    conn.execute("DELETE FROM passages WHERE doc_id = ?", (doc_id,))
+    conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+
+def build(conn: sqlite3.Connection, patterns=None, prune=True) -> dict:
+    """
+    Brings the index up to date with the given sources: new or changed files
+    (by content hash) are (re)indexed; with prune, indexed files that no
+    longer exist are dropped. Returns counts per outcome.
+    """
+    paths = resolve_sources(patterns or DEFAULT_SOURCES)
+    known = {row[1]: row for row in conn.execute("SELECT id, path, mtime, size, sha FROM docs")}
+    stats = {"indexed": 0, "unchanged": 0, "removed": 0, "passages": 0}
+    with conn:
+        for path in paths:
+            st = os.stat(path)
+            row = known.get(path)
+            if row and row[2] == st.st_mtime_ns and row[3] == st.st_size:
+                stats["unchanged"] += 1
+                continue
+            sha = file_hash(path)
+            if row and row[4] == sha:
+                conn.execute("UPDATE docs SET mtime = ?, size = ? WHERE id = ?",
+                             (st.st_mtime_ns, st.st_size, row[0]))
+                stats["unchanged"] += 1
+                continue
+            if row:
+                remove_doc(conn, row[0])
+            stats["passages"] += index_file(conn, path, st, sha)
+            stats["indexed"] += 1
+        if prune:
+            for path, row in known.items():
+                if not os.path.exists(path):
+                    remove_doc(conn, row[0])
+                    stats["removed"] += 1
+    return stats
+
+def snippet(text: str, query: str, width: int = 60) -> str:
+    """
+    A window of the passage around the best query match, with the matched
+    characters in **bold**. Matching ignores whitespace like the index does.
+    """
+    flat = text.replace("\n", " ")
+    # Map each normalized character back to its position in `flat`
+    positions = [i for i, ch in enumerate(flat) if normalize(ch)]
+    norm = "".join(normalize(flat[i]) for i in positions)
+    target = normalize(query)
+    at = norm.find(target)
+    length = len(target)
+    if at < 0:
+        # Fall back to the longest query word that occurs
+        for word in sorted(query.split(), key=len, reverse=True):
+            at = norm.find(normalize(word))
+            if at >= 0 and normalize(word):
+                length = len(normalize(word))
+                break
+    if at < 0 or not positions:
+        return flat[:width * 2] + ("…" if len(flat) > width * 2 else "")
+    begin, end = positions[at], positions[min(at + length, len(positions)) - 1] + 1
+    left, right = max(0, begin - width), min(len(flat), end + width)
+    return (("…" if left else "") + flat[left:begin] + "**" + flat[begin:end] + "**"
+            + flat[end:right] + ("…" if right < len(flat) else ""))
+
+def substring_postings(conn: sqlite3.Connection, needle: str) -> list[tuple]:
+    """
+    (needle, passage id, occurrences) for every passage whose normalized text
+    contains needle, found by a full scan of the passages.
+    """
+    postings = []
+    for pid, text in conn.execute("SELECT id, text FROM passages"):
+        tf = normalize(text).count(needle)
+        if tf:
+            postings.append((needle, pid, tf))
+    return postings
+
+def search(conn: sqlite3.Connection, query: str, k: int = 10, path_like: str | None = None) -> list[dict]:
+    """
+    BM25-ranked passages for the query, best first. Each hit has path, line,
+    page, table, section, score, snippet and the passage text. Queries
+    shorter than N characters have no n-gram to look up; they are answered
+    by scanning the passage texts for the substring.
+    """
+    grams = Counter(ngrams(query))
+    if not grams:
+        return []
+    total, avgdl = conn.execute("SELECT COUNT(*), AVG(length) FROM passages").fetchone()
+    if not total:
+        return []
+    if len(normalize(query)) < N:
+        postings = substring_postings(conn, normalize(query))
+    else:
+        placeholders = ",".join("?" * len(grams))
+        postings = conn.execute(
+            f"SELECT gram, passage_id, tf FROM postings WHERE gram IN ({placeholders})",
+            list(grams)).fetchall()
+    df = Counter(g for g, _, _ in postings)
+    by_passage = {}
+    for gram, pid, tf in postings:
+        by_passage.setdefault(pid, []).append((gram, tf))
+    lengths = dict(conn.execute(
+        f"SELECT id, length FROM passages WHERE id IN ({','.join('?' * len(by_passage))})",
+        list(by_passage)).fetchall()) if by_passage else {}
+
+    scores = {}
+    for pid, hits in by_passage.items():
+        norm = K1 * (1 - B + B * lengths[pid] / avgdl)
+        score = 0.0
+        for gram, tf in hits:
+            idf = math.log(1 + (total - df[gram] + 0.5) / (df[gram] + 0.5))
+            score += grams[gram] * idf * tf * (K1 + 1) / (tf + norm)
+        # Passages containing more of the distinct query grams rank first
+        scores[pid] = score * len(hits) / len(grams)
+
+    ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+    results = []
+    for pid, score in ranked:
+        row = conn.execute(
+            "SELECT d.path, p.line, p.page, p.tbl, p.section, p.text "
+            "FROM passages p JOIN docs d ON d.id = p.doc_id WHERE p.id = ?", (pid,)).fetchone()
+        if path_like and path_like not in row[0]:
+            continue
+        path, line, page, table, section, text = row
+        results.append({"path": path, "line": line, "page": page, "table": table,
+                        "section": section, "score": round(score, 3),
+                        "snippet": snippet(text, query), "text": text})
+        if len(results) >= k:
+            break
+    return results
+
+def format_location(hit: dict) -> str:
+    parts = [f"{hit['path']}:{hit['line']}"]
+    if hit["page"] is not None:
+        parts.append(f"p.{hit['page']}")
+    if hit["table"]:
+        parts.append(f"표 {hit['table']}")
+    if hit["section"]:
+        parts.append(f"§ {hit['section']}")
+    return " | ".join(parts)
+
+def main():
+    parser = argparse.ArgumentParser(description="n-gram full-text index over 3rd-cycle content and reports")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_build = sub.add_parser("build", help="Index new/changed files")
+    p_build.add_argument("sources", nargs="*", help="Files or globs (default: extractor outputs and report/*.md)")
+    p_query = sub.add_parser("query", help="Search the index")
+    p_query.add_argument("text")
+    p_query.add_argument("-k", type=int, default=10)
+    p_query.add_argument("--path", type=str, help="Only hits whose path contains this")
+    args = parser.parse_args()
+
+    conn = connect()
+    if args.command == "build":
+        start = time.perf_counter()
+        sources = DEFAULT_SOURCES + args.sources
+        stats = build(conn, sources)
+        print(f"Indexed {stats['indexed']} file(s) ({stats['passages']} passages), "
+              f"{stats['unchanged']} unchanged, {stats['removed']} removed "
+              f"in {time.perf_counter() - start:.2f}s")
+    else:
+        # Keep the index current before answering
+        build(conn, DEFAULT_SOURCES, prune=False)
+        start = time.perf_counter()
+        hits = search(conn, args.text, args.k, args.path)
+        elapsed = (time.perf_counter() - start) * 1000
+        if not normalize(args.text):
+            print("Query has no letters or digits to search for.")
+        elif len(normalize(args.text)) < N:
+            print(f"Query is shorter than {N} characters; scanned all passages for it.")
+        for rank, hit in enumerate(hits, 1):
+            print(f"{rank:2}. [{hit['score']:.2f}] {format_location(hit)}")
+            print(f"    {hit['snippet']}")
+        print(f"{len(hits)} hit(s) in {elapsed:.1f} ms")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
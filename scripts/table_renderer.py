@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+# --- Cycle colour rules ---
+# 3rd cycle data is blue, 4th cycle (new analysis/indicators) is orange
+COLOR_3RD = "#1f77b4"
+COLOR_4TH = "#ff7f0e"
+LAST_3RD_CYCLE_YEAR = 2023
+
+def cycle_colors(years: pd.Series) -> pd.Series:
+    """
+    Returns the cycle colour for every year (<= 2023: 3rd cycle, later: 4th).
+    """
+    years = pd.to_numeric(years, errors="coerce")
+    return pd.Series(np.where(years <= LAST_3RD_CYCLE_YEAR, COLOR_3RD, COLOR_4TH),
+                     index=years.index)
+
+def format_column(values: pd.Series, fmt: str | None = None) -> pd.Series:
+    """
+    Formats a whole column at once.
+    fmt is a printf-style format such as "%.2f" or "%d"; None uses str().
+    """
+    if fmt is None:
+        return values.astype(str)
+    return pd.Series(np.char.mod(fmt, values.to_numpy()), index=values.index)
+
+def format_cells(df: pd.DataFrame, columns: list[str],
+                 formats: dict | None = None) -> pd.DataFrame:
+    """
+    Builds a DataFrame of cell strings for the given columns.
+    Columns missing from df render as empty cells.
+    """
+    formats = formats or {}
+    cells = {}
+    for col in columns:
+        if col in df.columns:
+            cells[col] = format_column(df[col], formats.get(col))
+        else:
+            cells[col] = pd.Series("", index=df.index)
+    return pd.DataFrame(cells, index=df.index)
+
+def color_cells(cells: pd.DataFrame, colors: pd.Series | str,
+                style: str = "color:{color};") -> pd.DataFrame:
+    """
+    Wraps every cell in <span style="..."> with its row's colour.
+    colors is one colour for all rows or a per-row Series (see cycle_colors).
+    """
+    if isinstance(colors, str):
+        styles = pd.Series(style.format(color=colors), index=cells.index)
+    else:
+        styles = colors.map({c: style.format(color=c) for c in colors.unique()})
+    opening = '<span style="' + styles + '">'
+    return cells.apply(lambda col: opening + col + "</span>")
+
+def render_markdown(cells: pd.DataFrame, header: list[str] | None = None) -> str:
+    """
+    Renders cell strings as Markdown table rows, with an optional header.
+    """
+    if cells.empty:
+        body = []
+    else:
+        body = ("| " + cells.iloc[:, 0].str.cat(cells.iloc[:, 1:], sep=" | ") + " |").tolist()
+    if header is None:
+        return "\n".join(body)
+    head = "| " + " | ".join(header) + " |\n" + "|---" * len(header) + "|\n"
+    return head + "\n".join(body)
+
+def render_html_rows(cells: pd.DataFrame, indent: str = "    ") -> str:
+    """
+    Renders cell strings as <tr>/<td> rows for an existing HTML <tbody>.
+    """
+    if cells.empty:
+        return ""
+    tds = cells.apply(lambda col: "<td>" + col + "</td>")
+    inner = tds.iloc[:, 0].str.cat(tds.iloc[:, 1:], sep=f"\n{indent}  ")
+    rows = f"{indent}<tr>\n{indent}  " + inner + f"\n{indent}</tr>"
+    return "\n".join(rows.tolist())
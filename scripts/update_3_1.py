@@ -1,55 +1,91 @@
 import os
+import numpy as np
 import pandas as pd
-import re
 import argparse
+import instrument
+import metrics_store
+from instrument import stage
+from llm_blocks import make_job, run_jobs
+from renderer import update_markdown_blocks
+from table_renderer import (LAST_3RD_CYCLE_YEAR, color_cells, cycle_colors,
+                            format_cells, render_html_rows, render_markdown)
 # from google import generativeai as genai # Commented out as we don't have API key yet
 
 # --- Configuration ---
 DATA_PATH = "data/4th-cycle/3.1/faculty_numbers_2021_2025.csv"
 MD_PATH = "criteria/3.1-교원-확보-및-구성/3.1-교원-확보-및-구성.md"
+STAGES_PATH = instrument.stages_path("3.1")
+ANALYSIS_PROMPT_PATH = "scripts/prompts/3.1_analysis.txt"
+IMPROVEMENT_PROMPT_PATH = "scripts/prompts/3.1_improvement.txt"
+
+# 4th cycle handbook: the 3-year average of the combined ratio is checked against 64%
+THRESHOLD_PCT = 64.0
+WINDOW_YEARS = 3
+INSTITUTION_COL = "학교명"
 
 # --- Utils ---
-def calc_ratios(df: pd.DataFrame):
+def combined_pct(fulltime, adjunct, quota):
     """
-    Calculates ratios based on 4th cycle handbook formulas.
+    4th cycle formula on arrays (broadcasting): returns A(%), B(%), the adjunct
+    contribution min(0.3 * B, 4.0) and the combined ratio A + min(0.3 * B, 4.0).
     """
-    df = df.copy()
-    # A(%) = Full-time / Quota * 100
-    df["A_fulltime_pct"] = df["전임교원수A"] / df["교원법정정원B"] * 100
-    # B(%) = Adjunct / Quota * 100
-    df["B_adjunct_pct"] = df["겸임교원수"] / df["교원법정정원B"] * 100
-    
-    # Combined = A + min(0.3 * B, 4.0)
-    # Note: The formula is A + min(0.3*B, 4.0). 
-    # Wait, the advice says: "A + min(0.3 * B, 4.0)"
-    # But usually it means the *contribution* of B is capped at 4.0%? 
-    # Or the *total* is capped?
-    # "전임+겸임 확보율 = A + min(0.3 x B, 4.0)" -> This implies the adjunct contribution is capped at 4.0%.
-    # Let's verify. Yes, usually adjuncts can contribute up to 20% of the quota, or specific % points.
-    # The advice text says: "min(0.3 * B, 4.0)". So 0.3*B cannot exceed 4.0.
-    
-    df["adjunct_contribution"] = (0.3 * df["B_adjunct_pct"]).clip(upper=4.0)
-    df["combined_pct"] = df["A_fulltime_pct"] + df["adjunct_contribution"]
-
-    # Detail table: Year x Basis
-    detail = df.sort_values(["연도", "기준구분"])
-
-    # Final table: Min of (Student Quota, Enrolled Students) per Year
+    a_pct = fulltime / quota * 100
+    b_pct = adjunct / quota * 100
+    # The adjunct contribution is capped at 4.0%p, not the total
+    contribution = np.minimum(0.3 * b_pct, 4.0)
+    return a_pct, b_pct, contribution, a_pct + contribution
+
+def calc_ratios_batch(df: pd.DataFrame, institution_col: str = INSTITUTION_COL,
+                      window: int = WINDOW_YEARS):
+    """
+    Calculates ratios for many institutions at once (long format: one row per
+    institution x 연도 x 기준구분), without Python loops over groups.
+
+    Returns (detail, final). final has one row per institution and year with
+    the lower basis (final_basis, final_combined_pct) and the trailing
+    `window`-year mean of final_combined_pct (rolling_mean_pct; window_years
+    is the number of years actually in the window).
+    """
+    a_pct, b_pct, adjunct, combined = combined_pct(
+        df["전임교원수A"].to_numpy(dtype=float), df["겸임교원수"].to_numpy(dtype=float),
+        df["교원법정정원B"].to_numpy(dtype=float))
+    df = df.assign(A_fulltime_pct=a_pct, B_adjunct_pct=b_pct,
+                   adjunct_contribution=adjunct, combined_pct=combined)
+
+    # Detail table: Institution x Year x Basis
+    detail = df.sort_values([institution_col, "연도", "기준구분"], kind="stable")
+
+    # Final table: Min of (Student Quota, Enrolled Students) per institution and year
     final = (
-        df.loc[:, ["연도", "기준구분", "combined_pct"]]
-        .sort_values(["연도", "combined_pct"]) # Sort by pct ascending to get min first
-        .groupby("연도")
-        .first()
-        .reset_index()
+        df.loc[:, [institution_col, "연도", "기준구분", "combined_pct"]]
+        .sort_values([institution_col, "연도", "combined_pct"], kind="stable")
+        .drop_duplicates([institution_col, "연도"], keep="first")
+        .rename(columns={"combined_pct": "final_combined_pct", "기준구분": "final_basis"})
+        .reset_index(drop=True)
     )
-    final = final.rename(columns={"combined_pct": "final_combined_pct",
-                                  "기준구분": "final_basis"})
+
+    # Trailing mean over the years [year - window + 1, year] of the same
+    # institution: rows are sorted by (institution, year), so each window is a
+    # contiguous slice found with one searchsorted over a combined key
+    if final.empty:
+        return detail, final.assign(window_years=pd.Series(dtype=int),
+                                    rolling_mean_pct=pd.Series(dtype=float))
+    codes = pd.factorize(final[institution_col], sort=True)[0].astype(np.int64)
+    years = final["연도"].to_numpy(dtype=np.int64)
+    key = codes * (years.max() - years.min() + window + 1) + (years - years.min() + window)
+    end = np.arange(1, len(final) + 1)
+    start = np.searchsorted(key, key - (window - 1), side="left")
+    csum = np.concatenate([[0.0], np.cumsum(final["final_combined_pct"].to_numpy())])
+    final["window_years"] = end - start
+    final["rolling_mean_pct"] = (csum[end] - csum[start]) / final["window_years"]
     return detail, final
 
-def replace_between_markers(text: str, start_marker: str, end_marker: str, new_block: str) -> str:
-    pattern = f"({re.escape(start_marker)})(.*?)({re.escape(end_marker)})"
-    replacement = f"\\1\n{new_block.strip()}\n\\3"
-    return re.sub(pattern, replacement, text, flags=re.DOTALL)
+def calc_ratios(df: pd.DataFrame):
+    """
+    Calculates ratios based on 4th cycle handbook formulas for one institution.
+    """
+    detail, final = calc_ratios_batch(df.assign(**{INSTITUTION_COL: ""}))
+    return detail.drop(columns=INSTITUTION_COL), final.drop(columns=INSTITUTION_COL)
 
 def call_gemini_placeholder(prompt: str) -> str:
     # Placeholder for LLM call
@@ -61,86 +97,125 @@ def update_tables():
         print(f"Data file not found: {DATA_PATH}")
         return "", "", ""
         
-    df = pd.read_csv(DATA_PATH)
-    detail, final = calc_ratios(df)
-
-    # (1) Detail Table HTML
-    rows = []
-    for _, row in detail.iterrows():
-        year = int(row["연도"])
-        basis = row["기준구분"]
-        a = row["A_fulltime_pct"]
-        b = row["B_adjunct_pct"]
-        c = row["combined_pct"]
-        rows.append(f"| {year} | {basis} | {a:.2f} | {b:.2f} | {c:.2f} |")
-    
-    detail_table = "| 연도 | 기준구분 | 전임 A(%) | 겸임 B(%) | A+min(0.3B,4.0)(%) |\n|---|---|---|---|---|\n" + "\n".join(rows)
-
-    # (2) 3rd Cycle Rows (2021-2023)
-    rows_3rd = []
-    # (3) 4th Cycle Rows (2024-2025)
-    rows_4th = []
-    
-    for _, row in final.iterrows():
-        year = int(row["연도"])
-        val = row["final_combined_pct"]
-        basis = row["final_basis"]
-        status = '기준값 충족' if val >= 64 else '기준값 미충족'
-        
-        if year <= 2023:
-            color = "#1f77b4" # Blue
-            row_html = f"""    <tr>
-      <td><span style="color:{color};">{year}</span></td>
-      <td><span style="color:{color};">{val:.2f}</span></td>
-      <td><span style="color:{color};">{status}</span></td>
-      <td><span style="color:{color};">{basis} 기준 사용</span></td>
-    </tr>"""
-            rows_3rd.append(row_html)
-        else:
-            color = "#ff7f0e" # Orange
-            row_html = f"""    <tr>
-      <td><span style="color:{color};">{year}</span></td>
-      <td><span style="color:{color};">{val:.2f}</span></td>
-      <td><span style="color:{color};">{status}</span></td>
-      <td><span style="color:{color};">{basis} 기준 사용</span></td>
-    </tr>"""
-            rows_4th.append(row_html)
-
-    return detail_table, "\n".join(rows_3rd), "\n".join(rows_4th)
+    with stage("load_csv", source=os.path.basename(DATA_PATH)) as rec:
+        df = pd.read_csv(DATA_PATH)
+        rec["rows"] = len(df)
+    with stage("calc_ratios", rows=len(df)):
+        detail, final = calc_ratios(df)
+
+    # Typed results go to the metrics store; the tables are rendered from it
+    conn = metrics_store.connect()
+    with stage("store", rows=len(detail) + len(final)):
+        metrics_store.replace_source(conn, "3.1", "faculty_numbers", detail,
+                                     year_col="연도", basis_col="기준구분")
+        metrics_store.replace_source(conn, "3.1", "faculty_numbers_final", final, year_col="연도")
+
+    with stage("render_tables", rows=len(detail) + len(final)):
+        detail = metrics_store.load_source(conn, "3.1", "faculty_numbers",
+                                           year_col="연도", basis_col="기준구분")
+        final = metrics_store.load_source(conn, "3.1", "faculty_numbers_final", year_col="연도")
+        conn.close()
+        return render_ratio_tables(detail, final)
+
+def render_ratio_tables(detail: pd.DataFrame, final: pd.DataFrame):
+
+    # (1) Detail Table
+    detail_cells = format_cells(
+        detail, ["연도", "기준구분", "A_fulltime_pct", "B_adjunct_pct", "combined_pct"],
+        {"연도": "%d", "A_fulltime_pct": "%.2f", "B_adjunct_pct": "%.2f", "combined_pct": "%.2f"})
+    detail_table = render_markdown(
+        detail_cells, ["연도", "기준구분", "전임 A(%)", "겸임 B(%)", "A+min(0.3B,4.0)(%)"])
+
+    # (2) 3rd Cycle Rows (2021-2023, Blue) / (3) 4th Cycle Rows (2024-2025, Orange)
+    final = final.assign(
+        status=np.where(final["final_combined_pct"] >= THRESHOLD_PCT, "기준값 충족", "기준값 미충족"),
+        basis_note=final["final_basis"] + " 기준 사용")
+    final_cells = format_cells(
+        final, ["연도", "final_combined_pct", "status", "basis_note"],
+        {"연도": "%d", "final_combined_pct": "%.2f"})
+    final_cells = color_cells(final_cells, cycle_colors(final["연도"]))
+
+    is_3rd = (final["연도"] <= LAST_3RD_CYCLE_YEAR).to_numpy()
+    rows_3rd = render_html_rows(final_cells[is_3rd])
+    rows_4th = render_html_rows(final_cells[~is_3rd])
+
+    return detail_table, rows_3rd, rows_4th
 
 def update_text_blocks(detail_table: str, rows_3rd: str, rows_4th: str):
     if not os.path.exists(MD_PATH):
         print(f"Markdown file not found: {MD_PATH}")
         return
 
-    with open(MD_PATH, 'r', encoding='utf-8') as f:
-        text = f.read()
-
-    # Update Detail Table
-    text = replace_between_markers(text, "<!-- AUTO-GEN:3.1-DETAIL-RATIO-TABLE-START -->", "<!-- AUTO-GEN:3.1-DETAIL-RATIO-TABLE-END -->", detail_table)
-    
-    # Update 3rd Cycle Rows
-    text = replace_between_markers(text, "<!-- AUTO-GEN:3.1-RATIO-3RD-START -->", "<!-- AUTO-GEN:3.1-RATIO-3RD-END -->", rows_3rd)
-    
-    # Update 4th Cycle Rows
-    text = replace_between_markers(text, "<!-- AUTO-GEN:3.1-RATIO-4TH-START -->", "<!-- AUTO-GEN:3.1-RATIO-4TH-END -->", rows_4th)
-    
-    # Update Analysis (Placeholder)
-    analysis_text = call_gemini_placeholder("analysis prompt")
-    text = replace_between_markers(text, "<!-- AUTO-GEN:3.1-ANALYSIS-START -->", "<!-- AUTO-GEN:3.1-ANALYSIS-END -->", f'<span style="color:#ff7f0e;">{analysis_text}</span>')
-    
-    # Update Improvement (Placeholder)
-    improvement_text = call_gemini_placeholder("improvement prompt")
-    text = replace_between_markers(text, "<!-- AUTO-GEN:3.1-IMPROVEMENT-START -->", "<!-- AUTO-GEN:3.1-IMPROVEMENT-END -->", f'<span style="color:#ff7f0e;">{improvement_text}</span>')
-
-    with open(MD_PATH, 'w', encoding='utf-8') as f:
-        f.write(text)
-    print(f"Updated {MD_PATH}")
+    # Analysis / Improvement run concurrently; the placeholder is used when
+    # no response is available (e.g. no API key and nothing cached)
+    inputs = {"criterion": "3.1", "title": "교원 확보 및 구성", "fulltime_ratio": detail_table}
+    jobs = []
+    for block_id, prompt_path in [("3.1-ANALYSIS", ANALYSIS_PROMPT_PATH),
+                                  ("3.1-IMPROVEMENT", IMPROVEMENT_PROMPT_PATH)]:
+        with open(prompt_path, 'r', encoding='utf-8') as f:
+            jobs.append(make_job(block_id, f.read(), inputs))
+    with stage("llm", blocks=len(jobs)):
+        analysis_text, improvement_text = [
+            text if text is not None else call_gemini_placeholder(job["prompt"])
+            for job, text in zip(jobs, run_jobs(jobs))]
+
+    # All blocks are written in a single atomic rewrite of the report
+    with stage("write_report", blocks=5):
+        update_markdown_blocks(MD_PATH, {
+            "3.1-DETAIL-RATIO-TABLE": detail_table.strip(),
+            "3.1-RATIO-3RD": rows_3rd.strip(),
+            "3.1-RATIO-4TH": rows_4th.strip(),
+            "3.1-ANALYSIS": f'<span style="color:#ff7f0e;">{analysis_text}</span>'.strip(),
+            "3.1-IMPROVEMENT": f'<span style="color:#ff7f0e;">{improvement_text}</span>'.strip(),
+        })
+
+def run_batch(input_path: str, output_path: str | None = None):
+    """
+    Peer comparison: ratios and rolling 3-year means for every institution in
+    a long-format CSV (학교명, 연도, 기준구분, 전임교원수A, 겸임교원수, 교원법정정원B).
+    """
+    with stage("load_csv", source=os.path.basename(input_path)) as rec:
+        df = pd.read_csv(input_path, encoding="utf-8-sig")
+        rec["rows"] = len(df)
+    with stage("calc_ratios_batch", rows=len(df)):
+        _, final = calc_ratios_batch(df)
+    final["meets_threshold"] = (final["window_years"] == WINDOW_YEARS) & \
+                               (final["rolling_mean_pct"] >= THRESHOLD_PCT)
+
+    output_path = output_path or os.path.splitext(input_path)[0] + "_ratios.csv"
+    final.to_csv(output_path, index=False, encoding="utf-8-sig")
+    latest = final.drop_duplicates(INSTITUTION_COL, keep="last")
+    print(f"{final[INSTITUTION_COL].nunique()} institutions, {len(final)} institution-years; "
+          f"{int(latest['meets_threshold'].sum())} meet the {WINDOW_YEARS}-year "
+          f"{THRESHOLD_PCT:g}% threshold in their latest year")
+    print(f"Saved {output_path}")
 
 def main():
-    detail_table, rows_3rd, rows_4th = update_tables()
-    if detail_table:
-        update_text_blocks(detail_table, rows_3rd, rows_4th)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=str, metavar="CSV",
+                        help="Compute ratios for many institutions (peer comparison) instead")
+    parser.add_argument("--out", type=str, help="Output CSV for --batch")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Record per-stage timings into {STAGES_PATH}")
+    parser.add_argument("--trace", type=str, metavar="FILE",
+                        help="Also write a Chrome trace (implies --profile)")
+    args = parser.parse_args()
+    if args.profile or args.trace:
+        instrument.enable()
+
+    if args.batch:
+        run_batch(args.batch, args.out)
+    else:
+        detail_table, rows_3rd, rows_4th = update_tables()
+        if detail_table:
+            update_text_blocks(detail_table, rows_3rd, rows_4th)
+
+    if instrument.ENABLED:
+        # Batch runs keep their own key so they do not replace the report run's stages
+        instrument.merge_stages(STAGES_PATH, "update_3_1.batch" if args.batch else "update_3_1",
+                                instrument.records())
+    if args.trace:
+        instrument.write_chrome_trace(args.trace)
 
 if __name__ == "__main__":
     main()
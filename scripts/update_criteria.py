@@ -1,80 +1,384 @@
 import os
+import glob
+import time
 import yaml
 import json
 import argparse
-from parsers import parse_fulltime_ratio, parse_new_hires
-from renderer import update_markdown_block
+from cache_utils import file_hash
+from concurrent.futures import ThreadPoolExecutor
+import parser_registry
+from renderer import update_markdown_blocks
+from llm_blocks import make_job, run_jobs
+import instrument
+from instrument import stage
 
-# Map parser names to functions
-PARSERS = {
-    "parse_fulltime_ratio": parse_fulltime_ratio,
-    "parse_new_hires": parse_new_hires
-}
+# Parsers are resolved per data source through parser_registry and imported on
+# first use. metrics_store and table_renderer (pandas) are imported once a
+# criterion is processed, so --help and build.py's graph (a no-op build)
+# start without loading pandas.
 
 def load_config(criterion_id):
     config_path = os.path.join("criteria", criterion_id, "config.yml")
     with open(config_path, 'r', encoding='utf-8') as f:
         return yaml.safe_load(f)
 
-def process_criterion(criterion_id):
+def discover_criteria():
+    """
+    Returns the IDs of all criteria that have a criteria/<id>/config.yml.
+    """
+    paths = glob.glob(os.path.join("criteria", "*", "config.yml"))
+    return sorted(os.path.basename(os.path.dirname(p)) for p in paths)
+
+def resolve_report_path(criterion_id, config):
+    """
+    Resolves the report file from the config's "report" key (relative to the
+    config, like data_sources files), or else the single report/<id> *.md file.
+    """
+    if config.get('report'):
+        return os.path.abspath(os.path.join("criteria", criterion_id, config['report']))
+    matches = glob.glob(os.path.join("report", f"{glob.escape(criterion_id)} *.md"))
+    if len(matches) == 1:
+        return matches[0]
+    return None
+
+def source_files(criterion_id, source):
+    """
+    Resolves a data source's files (relative to the config) to absolute paths.
+    """
+    return [os.path.abspath(os.path.join("criteria", criterion_id, f)) for f in source['files']]
+
+def parse_source(conn, criterion_id, source, keep_on_error=True):
+    """
+    Parses one data source into the metrics store. Returns False when none
+    of its files exist (any records stored earlier are then dropped). A
+    parser returns None when none of the files could be read; the stored
+    records are then kept, and False is returned unless keep_on_error.
+    """
+    import metrics_store
+    # Check if files exist
+    valid_files = [f for f in source_files(criterion_id, source) if os.path.exists(f)]
+    if not valid_files:
+        print(f"Warning: No valid files found for {source['id']}")
+        metrics_store.delete_source(conn, criterion_id, source['id'])
+        return False
+
+    print(f"  Parsing {source['id']} from {len(valid_files)} files...")
+    with stage("parse", criterion=criterion_id, source=source['id'],
+               files=len(valid_files)) as rec:
+        records = parser_registry.get_parser(source)(valid_files)
+        rec["rows"] = 0 if records is None else len(records)
+    if records is None:
+        # The parser could read none of the files; keep what was stored before
+        print(f"Warning: Could not read any file of {source['id']}; keeping the stored records")
+        return keep_on_error
+    metrics_store.replace_source(conn, criterion_id, source['id'], records, year_col="Year",
+                                 basis_col=source.get('basis_col'))
+    return True
+
+def render_source(conn, criterion_id, source):
+    """
+    Renders one data source from the metrics store.
+    Returns (typed records, Markdown) or None if nothing is stored.
+    """
+    import metrics_store
+    with stage("render", criterion=criterion_id, source=source['id']):
+        stored = metrics_store.load_source(conn, criterion_id, source['id'], year_col="Year",
+                                           basis_col=source.get('basis_col'))
+        if stored.empty:
+            return None
+        data = parser_registry.get_renderer(source)(stored)
+    return json.loads(stored.to_json(orient="records", force_ascii=False)), data
+
+def parse_criterion(criterion_id, parse=True):
+    """
+    Parses every data source of a criterion into the metrics store, renders
+    the stored records and prepares the LLM jobs. With parse=False the
+    records already in the store are rendered as they are. Nothing is
+    written to the report yet; see write_criterion.
+    """
+    import metrics_store
     print(f"Processing Criterion {criterion_id}...")
     config = load_config(criterion_id)
     
     metrics = {}
+    tables = {}
+    block_updates = {}
+    conn = metrics_store.connect()
     
-    # 1. Parse Data
     for source in config.get('data_sources', []):
-        parser_name = source['parser']
-        if parser_name in PARSERS:
-            files = source['files']
-            # Resolve relative paths
-            abs_files = [os.path.abspath(os.path.join("criteria", criterion_id, f)) for f in files]
-            
-            # Check if files exist
-            valid_files = [f for f in abs_files if os.path.exists(f)]
-            if not valid_files:
-                print(f"Warning: No valid files found for {source['id']}")
+        if parser_registry.is_available(source):
+            # 1. Parse Data into the store
+            if parse and not parse_source(conn, criterion_id, source):
                 continue
-                
-            print(f"  Parsing {source['id']} from {len(valid_files)} files...")
-            data = PARSERS[parser_name](valid_files)
-            metrics[source['id']] = data
-            
-            # Update Markdown immediately (or collect all and update later)
-            target_block = source['target_block']
-            
-            # Map criterion ID to Korean filename
-            filename_map = {
-                "3.1": "3.1 교원 확보 및 구성.md",
-                "3.2": "3.2 교원 인사 및 업적평가.md",
-                "3.3": "3.3 교원 처우 및 복지.md",
-                "3.4": "3.4 교원의 연구활동 및 성과.md",
-                "3.5": "3.5 직원 확보 및 인사.md",
-                "3.6": "3.6 직원 복지 및 업무 역량 개발.md"
-            }
-            
-            md_filename = filename_map.get(criterion_id)
-            if not md_filename:
-                print(f"Error: No filename mapping for {criterion_id}")
+
+            # 2. Render from the store
+            rendered = render_source(conn, criterion_id, source)
+            if rendered is None and not parse:
                 continue
-                
-            md_file = os.path.join("report", md_filename)
-            
-            update_markdown_block(md_file, target_block, data)
+            metrics[source['id']], data = rendered or ([], "")
+            tables[source['id']] = data
             
-    # 2. LLM Processing (Placeholder)
-    # for block in config.get('llm_blocks', []):
-    #     ...
+            # Collect block updates; the report is rewritten once later
+            block_updates[source['target_block']] = data
+    conn.close()
+
+    # 3. LLM blocks: prompts are rendered with the source tables as inputs
+    llm_jobs = []
+    for block in config.get('llm_blocks', []):
+        template_path = os.path.join("criteria", criterion_id, block['prompt_template'])
+        if not os.path.exists(template_path):
+            print(f"Warning: Prompt template not found for {block['id']}: {template_path}")
+            continue
+        with open(template_path, 'r', encoding='utf-8') as f:
+            template_text = f.read()
+        inputs = {"criterion": criterion_id, "title": config.get('title', ''), **tables}
+        llm_jobs.append(make_job(block['target_block'], template_text, inputs, block.get('model')))
+
+    return {"config": config, "metrics": metrics,
+            "block_updates": block_updates, "llm_jobs": llm_jobs}
+
+def write_criterion(criterion_id, state, llm_results):
+    """
+    Writes the data and LLM blocks into the report in one pass and saves metrics.
+    """
+    from table_renderer import COLOR_4TH
+    block_updates = dict(state["block_updates"])
+    for job, text in zip(state["llm_jobs"], llm_results):
+        if text is not None:
+            block_updates[job["block_id"]] = f'<span style="color:{COLOR_4TH};">{text.strip()}</span>'
 
-    # Save metrics for debugging
+    written = False
+    if block_updates:
+        md_file = resolve_report_path(criterion_id, state["config"])
+        if md_file:
+            with stage("write_report", criterion=criterion_id, blocks=len(block_updates)):
+                written = update_markdown_blocks(md_file, block_updates)
+        else:
+            print(f"Error: No report file found for {criterion_id}")
+
+    # Typed records per source (the same data as in metrics/metrics.db)
+    metrics = state["metrics"]
     os.makedirs("metrics", exist_ok=True)
     with open(f"metrics/{criterion_id}.json", 'w', encoding='utf-8') as f:
         json.dump(metrics, f, indent=2, ensure_ascii=False)
+    if instrument.ENABLED:
+        instrument.merge_stages(instrument.stages_path(criterion_id), "update_criteria",
+                                instrument.records(criterion=criterion_id))
     print(f"Finished Criterion {criterion_id}.")
+    return {"sources": sorted(metrics), "blocks": sorted(block_updates),
+            "report_written": written, "metrics": metrics}
+
+def process_criterion(criterion_id, llm_concurrency=4, parse=True):
+    state = parse_criterion(criterion_id, parse)
+    with stage("llm", criterion=criterion_id, blocks=len(state["llm_jobs"])):
+        llm_results = run_jobs(state["llm_jobs"], concurrency=llm_concurrency)
+    return write_criterion(criterion_id, state, llm_results)
+
+def process_all(workers=4, llm_concurrency=4):
+    """
+    Processes every criterion. Parsing runs in a thread pool; threads share this
+    interpreter, so pandas and the parsers are imported once for all criteria.
+    The LLM prompts of all criteria then run concurrently in one batch.
+    Writes a combined metrics/all.json and prints a summary.
+    """
+    criteria = discover_criteria()
+    timings = {}
+    results = {}
+
+    def parse(criterion_id):
+        start = time.perf_counter()
+        try:
+            state = parse_criterion(criterion_id)
+        except Exception as e:
+            state = {"error": str(e)}
+        timings[criterion_id] = time.perf_counter() - start
+        return criterion_id, state
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        states = dict(pool.map(parse, criteria))
+
+    ok = [cid for cid in criteria if "error" not in states[cid]]
+    all_jobs = [job for cid in ok for job in states[cid]["llm_jobs"]]
+    with stage("llm", criterion="*", blocks=len(all_jobs)):
+        all_results = iter(run_jobs(all_jobs, concurrency=llm_concurrency))
+
+    for cid in criteria:
+        state = states[cid]
+        if "error" in state:
+            results[cid] = {"status": "error", "error": state["error"]}
+            continue
+        llm_results = [next(all_results) for _ in state["llm_jobs"]]
+        start = time.perf_counter()
+        try:
+            results[cid] = write_criterion(cid, state, llm_results)
+            results[cid]["status"] = "ok"
+        except Exception as e:
+            results[cid] = {"status": "error", "error": str(e)}
+        timings[cid] += time.perf_counter() - start
+
+    for cid in criteria:
+        results[cid]["seconds"] = round(timings[cid], 3)
+
+    os.makedirs("metrics", exist_ok=True)
+    with open("metrics/all.json", 'w', encoding='utf-8') as f:
+        json.dump({cid: r.get("metrics", {}) for cid, r in results.items()},
+                  f, indent=2, ensure_ascii=False)
+    if instrument.ENABLED:
+        instrument.merge_stages(instrument.stages_path("all"), "update_criteria", instrument.records())
+
+    print("\n=== Summary ===")
+    for cid, r in results.items():
+        if r["status"] == "ok":
+            state = "updated" if r["report_written"] else "unchanged"
+            print(f"  {cid}: {len(r['sources'])} source(s), {len(r['blocks'])} block(s), "
+                  f"report {state} ({r['seconds']}s)")
+        else:
+            print(f"  {cid}: ERROR {r['error']} ({r['seconds']}s)")
+    return results
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def watch(criterion_ids, interval=0.2):
+    """
+    Keeps the given criteria loaded and polls the files their config.yml
+    references. When a data file changes, only the sources reading it are
+    re-parsed and only their target_blocks are rewritten; a changed
+    config.yml reloads that criterion. LLM blocks are not regenerated here
+    (run without --watch for those). Stops on Ctrl+C.
+    """
+    import metrics_store
+    conn = metrics_store.connect()
+    criteria = {}   # criterion id -> {"config", "report", "metrics"}
+    watched = {}    # path -> (criterion id, source or None for config.yml)
+    signatures = {}  # path -> ((mtime_ns, size), content hash)
+
+    def load(cid):
+        # Full pass for one criterion: parse every source, write its data blocks.
+        # Parsing comes first so a failure leaves the previous entry in place.
+        state = parse_criterion(cid)
+        for path in [p for p, (c, _) in watched.items() if c == cid]:
+            del watched[path]
+        config_path = os.path.join("criteria", cid, "config.yml")
+        watched[config_path] = (cid, None)
+        config = state["config"]
+        criteria[cid] = {"config": config, "metrics": state["metrics"],
+                         "report": resolve_report_path(cid, config)}
+        for source in config.get('data_sources', []):
+            if parser_registry.is_available(source):
+                for path in source_files(cid, source):
+                    watched[path] = (cid, source)
+        if criteria[cid]["report"] and state["block_updates"]:
+            update_markdown_blocks(criteria[cid]["report"], state["block_updates"])
+        for path in watched:
+            if path not in signatures:
+                sig = _file_signature(path)
+                signatures[path] = (sig, file_hash(path) if sig else None)
+
+    def refresh(cid, sources):
+        # Returns the ids of the sources that could not be parsed
+        entry = criteria[cid]
+        updates, failed = {}, []
+        for source in sources:
+            if not parse_source(conn, cid, source, keep_on_error=False):
+                failed.append(source['id'])
+                continue
+            records, data = render_source(conn, cid, source) or ([], "")
+            entry["metrics"][source['id']] = records
+            updates[source['target_block']] = data
+        if updates and entry["report"]:
+            update_markdown_blocks(entry["report"], updates)
+            with open(f"metrics/{cid}.json", 'w', encoding='utf-8') as f:
+                json.dump(entry["metrics"], f, indent=2, ensure_ascii=False)
+        return failed
+
+    for cid in criterion_ids:
+        load(cid)
+    print(f"Watching {len(watched)} file(s) of {len(criteria)} criteria (Ctrl+C to stop)...")
+
+    try:
+        while True:
+            time.sleep(interval)
+            changed = []
+            for path in list(watched):
+                sig = _file_signature(path)
+                old_sig, old_hash = signatures.get(path, (None, None))
+                if sig == old_sig:
+                    continue
+                try:
+                    new_hash = file_hash(path) if sig else None
+                except OSError:
+                    continue
+                signatures[path] = (sig, new_hash)
+                if new_hash != old_hash:
+                    changed.append(path)
+            if not changed:
+                continue
+
+            start = time.perf_counter()
+            reload, sources, failed = set(), {}, []
+            for path in changed:
+                cid, source = watched[path]
+                if source is None:
+                    reload.add(cid)
+                else:
+                    sources.setdefault(cid, {})[source['id']] = source
+            for cid in reload:
+                try:
+                    load(cid)
+                except Exception as e:
+                    # e.g. a config.yml saved mid-edit; keep the previous entry until it parses
+                    print(f"[ERROR] {cid}: {e}")
+                    failed.append(f"{cid}/config.yml")
+            for cid, by_id in sources.items():
+                if cid not in reload:
+                    try:
+                        failed += [f"{cid}/{sid}" for sid in refresh(cid, list(by_id.values()))]
+                    except Exception as e:
+                        # e.g. a workbook caught mid-save; the next save triggers a retry
+                        print(f"[ERROR] {cid}: {e}")
+                        failed += [f"{cid}/{sid}" for sid in by_id]
+            names = ", ".join(os.path.basename(p) for p in changed)
+            ms = (time.perf_counter() - start) * 1000
+            if failed:
+                print(f"[{time.strftime('%H:%M:%S')}] {names} -> not updated: "
+                      f"{', '.join(failed)} ({ms:.0f} ms)")
+            else:
+                print(f"[{time.strftime('%H:%M:%S')}] {names} -> updated in {ms:.0f} ms")
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        conn.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--criterion", type=str, default="3.1")
+    parser.add_argument("--all", action="store_true",
+                        help="Process every criteria/*/config.yml concurrently")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and rewrite data blocks when their files change")
+    parser.add_argument("--llm-concurrency", type=int, default=4,
+                        help="Maximum number of LLM requests in flight")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record per-stage timings into metrics/stages/*.json")
+    parser.add_argument("--trace", type=str, metavar="FILE",
+                        help="Also write a Chrome trace (implies --profile)")
     args = parser.parse_args()
     
-    process_criterion(args.criterion)
+    if args.profile or args.trace:
+        instrument.enable()
+
+    if args.watch:
+        watch(discover_criteria() if args.all else [args.criterion])
+    elif args.all:
+        process_all(args.workers, args.llm_concurrency)
+    else:
+        process_criterion(args.criterion, args.llm_concurrency)
+
+    if args.trace:
+        instrument.write_chrome_trace(args.trace)
@@ -0,0 +1,166 @@
+"""
+What-if planning for 3.1: the fewest (cheapest) full-time and adjunct hires
+per year that keep the 3-year average of A + min(0.3 * B, 4.0) (lower of the
+학생정원/재학생 basis) at or above 64%, under a grid of quota scenarios.
+
+Usage:
+    python scripts/whatif_3_1.py
+    python scripts/whatif_3_1.py --years 4 --quota-growth -2 0 2 --enrolled-growth -5 0 5
+    python scripts/whatif_3_1.py --no-write        # only print the plan
+"""
+import os
+import sys
+import time
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+import metrics_store
+from instrument import stage
+from renderer import update_markdown_blocks
+from table_renderer import COLOR_4TH, color_cells, format_cells, render_markdown
+from update_3_1 import DATA_PATH, MD_PATH, THRESHOLD_PCT, WINDOW_YEARS, calc_ratios, combined_pct
+
+# --- Configuration ---
+BLOCK_ID = "3.1-HIRING-PLAN"
+BASES = ("학생정원", "재학생")
+
+def load_baseline(df: pd.DataFrame) -> dict:
+    """
+    Head counts and quotas of the latest year plus the final ratios of the
+    years still inside the rolling window. Raises ValueError when the
+    latest year lacks the row of one of the BASES.
+    """
+    last_year = int(df["연도"].max())
+    last = df[df["연도"] == last_year].set_index("기준구분")
+    missing = [b for b in BASES if b not in last.index]
+    if missing:
+        raise ValueError(f"{DATA_PATH} has no {', '.join(missing)} row for {last_year}")
+    _, final = calc_ratios(df)
+    return {
+        "year": last_year,
+        "fulltime": float(last.loc[BASES[0], "전임교원수A"]),
+        "adjunct": float(last.loc[BASES[0], "겸임교원수"]),
+        "quota": np.array([float(last.loc[b, "교원법정정원B"]) for b in BASES]),
+        "history": final["final_combined_pct"].to_numpy()[-(WINDOW_YEARS - 1):],
+    }
+
+def plan_hires(baseline: dict, growth: np.ndarray, years: int = 3,
+               max_fulltime: int = 40, max_adjunct: int = 60,
+               cost_fulltime: float = 1.0, cost_adjunct: float = 0.35,
+               attrition_fulltime: float = 0.0, attrition_adjunct: float = 0.0) -> pd.DataFrame:
+    """
+    For every quota scenario (one row of `growth`: annual % change of the
+    학생정원- and 재학생-based quota) and every planning year, picks the
+    cheapest (full-time, adjunct) hiring pair on the grid that keeps the
+    rolling mean at or above THRESHOLD_PCT, given the plans of earlier years.
+    All scenarios x hiring pairs of a year are evaluated as one array of shape
+    (scenarios, max_fulltime + 1, max_adjunct + 1). If no pair is feasible the
+    largest hiring is assumed and the row is marked infeasible.
+    """
+    n = len(growth)
+    f = np.arange(max_fulltime + 1, dtype=float)[None, :, None]
+    g = np.arange(max_adjunct + 1, dtype=float)[None, None, :]
+    cost = cost_fulltime * f + cost_adjunct * g
+
+    fulltime = np.full(n, baseline["fulltime"])
+    adjunct = np.full(n, baseline["adjunct"])
+    window = np.tile(baseline["history"], (n, 1))
+    rows = []
+    for step in range(1, years + 1):
+        # (scenarios, bases) -> broadcast against the hiring grid
+        quota = baseline["quota"][None, :] * (1 + growth / 100) ** step
+        ft, adj = np.broadcast_arrays((fulltime - attrition_fulltime)[:, None, None] + f,
+                                      (adjunct - attrition_adjunct)[:, None, None] + g)
+        per_basis = np.stack([combined_pct(ft, adj, quota[:, b, None, None])[3]
+                              for b in range(len(BASES))])
+        final = per_basis.min(axis=0)
+        basis = per_basis.argmin(axis=0)
+        rolling = (window.sum(axis=1)[:, None, None] + final) / (window.shape[1] + 1)
+
+        feasible = rolling >= THRESHOLD_PCT
+        masked = np.where(feasible, cost, np.inf).reshape(n, -1)
+        best = masked.argmin(axis=1)
+        ok = np.isfinite(masked[np.arange(n), best])
+        best = np.where(ok, best, masked.shape[1] - 1)
+        fi, gi = np.unravel_index(best, feasible.shape[1:])
+        idx = (np.arange(n), fi, gi)
+
+        fulltime = ft[idx]
+        adjunct = adj[idx]
+        chosen = final[idx]
+        window = np.concatenate([window, chosen[:, None]], axis=1)[:, -(WINDOW_YEARS - 1):]
+        rows.append(pd.DataFrame({
+            "quota_growth": growth[:, 0], "enrolled_growth": growth[:, 1],
+            "연도": baseline["year"] + step,
+            "fulltime_hires": fi, "adjunct_hires": gi,
+            "cost": cost_fulltime * fi + cost_adjunct * gi,
+            "fulltime_total": fulltime, "adjunct_total": adjunct,
+            "final_basis": np.asarray(BASES)[basis[idx]],
+            "final_combined_pct": chosen, "rolling_mean_pct": rolling[idx], "feasible": ok,
+        }))
+    return pd.concat(rows).sort_values(["quota_growth", "enrolled_growth", "연도"]).reset_index(drop=True)
+
+def render_plan(plan: pd.DataFrame) -> str:
+    plan = plan.assign(
+        scenario=plan["quota_growth"].map("{:+g}%".format) + " / "
+                 + plan["enrolled_growth"].map("{:+g}%".format),
+        note=np.where(plan["feasible"], plan["final_basis"] + " 기준",
+                      "범위 내 충족 불가(최대 채용 가정)"))
+    cells = format_cells(
+        plan, ["scenario", "연도", "fulltime_hires", "adjunct_hires",
+               "final_combined_pct", "rolling_mean_pct", "note"],
+        {"연도": "%d", "fulltime_hires": "%d", "adjunct_hires": "%d",
+         "final_combined_pct": "%.2f", "rolling_mean_pct": "%.2f"})
+    cells = color_cells(cells, COLOR_4TH)
+    return render_markdown(cells, ["정원 증감률(학생정원/재학생, 연)", "연도", "전임 채용(명)",
+                                   "겸임 채용(명)", "최종 확보율(%)", "3년 평균(%)", "비고"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimum hires to keep the 3.1 3-year average >= 64%")
+    parser.add_argument("--years", type=int, default=3, help="Planning years after the latest data")
+    parser.add_argument("--quota-growth", type=float, nargs="+", default=[-2.0, 0.0, 2.0],
+                        help="Annual %% change of the 학생정원-based quota (scenarios)")
+    parser.add_argument("--enrolled-growth", type=float, nargs="+", default=[-5.0, 0.0, 5.0],
+                        help="Annual %% change of the 재학생-based quota (scenarios)")
+    parser.add_argument("--max-fulltime", type=int, default=40)
+    parser.add_argument("--max-adjunct", type=int, default=60)
+    parser.add_argument("--cost-fulltime", type=float, default=1.0)
+    parser.add_argument("--cost-adjunct", type=float, default=0.35)
+    parser.add_argument("--attrition-fulltime", type=float, default=0.0,
+                        help="Full-time faculty leaving per year")
+    parser.add_argument("--attrition-adjunct", type=float, default=0.0)
+    parser.add_argument("--no-write", action="store_true", help="Do not update the report block")
+    args = parser.parse_args()
+
+    if not os.path.exists(DATA_PATH):
+        print(f"Data file not found: {DATA_PATH}")
+        return
+    try:
+        baseline = load_baseline(pd.read_csv(DATA_PATH))
+    except ValueError as e:
+        sys.exit(f"[ERROR] {e}")
+    growth = np.array(list(itertools.product(args.quota_growth, args.enrolled_growth)))
+
+    start = time.perf_counter()
+    with stage("plan_hires", scenarios=len(growth)):
+        plan = plan_hires(baseline, growth, args.years, args.max_fulltime, args.max_adjunct,
+                          args.cost_fulltime, args.cost_adjunct,
+                          args.attrition_fulltime, args.attrition_adjunct)
+    evaluated = len(growth) * (args.max_fulltime + 1) * (args.max_adjunct + 1) * args.years
+    print(f"Evaluated {evaluated:,} scenarios in {(time.perf_counter() - start) * 1000:.0f} ms")
+    print(plan[["quota_growth", "enrolled_growth", "연도", "fulltime_hires", "adjunct_hires",
+                "rolling_mean_pct", "feasible"]].to_string(index=False))
+
+    conn = metrics_store.connect()
+    metrics_store.replace_source(
+        conn, "3.1", "hiring_plan",
+        plan.assign(scenario=plan["quota_growth"].astype(str) + "/" + plan["enrolled_growth"].astype(str)),
+        year_col="연도", basis_col="scenario")
+    conn.close()
+
+    if not args.no_write:
+        update_markdown_blocks(MD_PATH, {BLOCK_ID: render_plan(plan)})
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import build
+
+
+def make_graph(root: Path) -> dict:
+    """
+    leaf.txt -> source (slow copy) -> mid.txt -> render -> report.md
+    """
+    def copy_slowly():
+        time.sleep(0.2)
+        (root / "mid.txt").write_text((root / "leaf.txt").read_text(encoding="utf-8"), encoding="utf-8")
+
+    def render():
+        text = (root / "mid.txt").read_text(encoding="utf-8")
+        (root / "report.md").write_text(f"# Report\n{text}\n", encoding="utf-8")
+
+    return {
+        "step:copy": {"inputs": ["leaf.txt"], "outputs": ["mid.txt"], "deps": [], "run": copy_slowly},
+        "step:render": {"inputs": ["mid.txt"], "outputs": ["report.md"], "deps": ["step:copy"],
+                        "run": render},
+    }
+
+
+def test_leaf_change_reaches_report_in_one_build(tmp_path, monkeypatch):
+    monkeypatch.setattr(build, "REPO_ROOT", tmp_path)
+    monkeypatch.setattr(build, "STATE_PATH", tmp_path / ".cache" / "build" / "state.json")
+    monkeypatch.setattr(build, "build_graph", lambda exclude=(): make_graph(tmp_path))
+
+    (tmp_path / "leaf.txt").write_text("first", encoding="utf-8")
+    assert build.build(jobs=4) == {"step:copy": "built", "step:render": "built"}
+    assert (tmp_path / "report.md").read_text(encoding="utf-8") == "# Report\nfirst\n"
+
+    (tmp_path / "leaf.txt").write_text("second", encoding="utf-8")
+    status = build.build(jobs=4)
+    assert status == {"step:copy": "built", "step:render": "built"}
+    assert (tmp_path / "report.md").read_text(encoding="utf-8") == "# Report\nsecond\n"
+
+    assert build.build(jobs=4) == {"step:copy": "fresh", "step:render": "fresh"}